@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tarfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Iterator
+from config import settings
+from utils.logger import logger
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tiff', '.tif'}
+
+# Output file names per rendered variant, matching what the bot sends
+OUTPUT_NAMES = {
+    'transparent_bytes': 'transparent',
+    'bw_bytes': 'bw',
+    'transparent_watermarked': 'transparent_watermarked',
+    'bw_watermarked': 'bw_watermarked',
+}
+
+_loop = None
+
+
+def _is_image(name: str) -> bool:
+    return Path(name).suffix.lower() in IMAGE_EXTENSIONS
+
+
+def iter_inputs(source: str) -> Iterator[tuple[str, bytes]]:
+    # Archives are read member by member so a large backfill never sits in memory at once
+    if os.path.isdir(source):
+        for path in sorted(Path(source).rglob("*")):
+            if path.is_file() and _is_image(path.name):
+                yield str(path.relative_to(source)), path.read_bytes()
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _is_image(info.filename):
+                    yield info.filename, archive.read(info)
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source, "r|*") as archive:
+            for member in archive:
+                if member.isfile() and _is_image(member.name):
+                    yield member.name, archive.extractfile(member).read()
+    else:
+        raise ValueError(f"{source} is neither a directory nor a zip/tar archive")
+
+
+def output_target(output_dir: str, name: str) -> Path:
+    # Archive member names are untrusted: absolute paths and ".." must not escape the output directory.
+    # The source extension stays in the directory name so a.jpg and a.png do not overwrite each other
+    root = Path(output_dir).resolve()
+    relative = Path(name.replace("\\", "/"))
+    if relative.is_absolute() or relative.drive or ".." in relative.parts:
+        raise ValueError(f"unsafe path {name!r}")
+    target = (root / relative).resolve()
+    if root not in target.parents:
+        raise ValueError(f"unsafe path {name!r}")
+    return target
+
+
+def _init_worker(overrides: dict):
+    global _loop
+    for key, value in overrides.items():
+        setattr(settings, key, value)
+    # The batch pool is the parallelism; nested image jobs run inline in each worker
+    settings.image_executor_mode = "inline"
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+
+
+def render_file(name: str, image_bytes: bytes, output_dir: str, backend_name: str, improved: bool) -> dict:
+    from photos.processor import prepare_image
+    from services.image_encoding import clean_extension, preview_extension
+    from services.image_service import PREVIEW_VARIANTS, ImageService
+    from services.removal_backends import get_backend
+
+    row = {"file": name, "input_bytes": len(image_bytes), "pid": os.getpid()}
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    try:
+        target = output_target(output_dir, name)
+
+        stage = time.perf_counter()
+        original_bytes = prepare_image(image_bytes)
+        row["prepare_seconds"] = time.perf_counter() - stage
+
+        stage = time.perf_counter()
+        cutout_bytes = _loop.run_until_complete(get_backend(backend_name).remove_background(original_bytes, improved))
+        row["remove_seconds"] = time.perf_counter() - stage
+
+        stage = time.perf_counter()
+        variants = ImageService.render_variants(cutout_bytes, original_bytes)
+        row["render_seconds"] = time.perf_counter() - stage
+
+        stage = time.perf_counter()
+        target.mkdir(parents=True, exist_ok=True)
+        for variant, data in variants.items():
+            extension = preview_extension() if variant in PREVIEW_VARIANTS else clean_extension()
+            (target / f"{OUTPUT_NAMES.get(variant, variant)}.{extension}").write_bytes(data)
+        row["write_seconds"] = time.perf_counter() - stage
+        row["output_bytes"] = sum(len(data) for data in variants.values())
+
+    except Exception as e:
+        row["error"] = str(e)
+
+    row["total_seconds"] = time.perf_counter() - started
+    row["cpu_seconds"] = time.process_time() - cpu_started
+    return row
+
+
+def run(args) -> list[dict]:
+    overrides = {"test_mode": False}
+    if args.stand_ins:
+        overrides["removal_use_stand_ins"] = True
+
+    rows = []
+    pool = ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=get_context("spawn"),
+        initializer=_init_worker, initargs=(overrides,)
+    )
+    with pool:
+        pending = set()
+        for name, image_bytes in iter_inputs(args.source):
+            # Bounded backlog: keep every worker busy without reading the whole source ahead
+            if len(pending) >= args.workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                rows += [future.result() for future in done]
+            pending.add(pool.submit(render_file, name, image_bytes, args.output, args.backend, args.improved))
+
+        rows += [future.result() for future in wait(pending).done]
+    return rows
+
+
+def print_report(rows: list[dict], wall: float):
+    ok = [row for row in rows if "error" not in row]
+    print(f"{'file':<40} {'total s':>8} {'remove s':>9} {'render s':>9} {'out KB':>9}")
+    for row in sorted(rows, key=lambda row: row["file"]):
+        if "error" in row:
+            print(f"{row['file']:<40} ERROR {row['error']}")
+            continue
+        print(
+            f"{row['file']:<40} {row['total_seconds']:>8.3f} {row['remove_seconds']:>9.3f} "
+            f"{row['render_seconds']:>9.3f} {row['output_bytes'] / 1024:>9.1f}"
+        )
+
+    totals = [row["total_seconds"] for row in ok]
+    cpu = sum(row["cpu_seconds"] for row in rows)
+    print(
+        f"\n{len(ok)}/{len(rows)} files in {wall:.1f} s ({len(ok) / wall if wall else 0:.2f} files/s), "
+        f"median {statistics.median(totals) if totals else 0:.3f} s/file, "
+        f"CPU utilisation {cpu / wall / os.cpu_count() * 100 if wall else 0:.0f}% of {os.cpu_count()} cores"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render background-removal variants for a directory or archive")
+    parser.add_argument("source", help="directory, .zip or .tar(.gz) archive of images")
+    parser.add_argument("--output", default="batch_output", help="directory for rendered variants")
+    parser.add_argument("--backend", default="local", help="removal backend name (local, openrouter, or a configured one)")
+    parser.add_argument("--stand-ins", action="store_true", help="replace remote backends with local stand-ins")
+    parser.add_argument("--improved", action="store_true", help="request the improved removal")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--report", help="per-file timing report path (default: <output>/report.json)")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    started = time.perf_counter()
+    rows = run(args)
+    wall = time.perf_counter() - started
+
+    print_report(rows, wall)
+    report_path = args.report or os.path.join(args.output, "report.json")
+    with open(report_path, "w") as f:
+        json.dump({"source": args.source, "backend": args.backend, "workers": args.workers,
+                   "wall_seconds": wall, "files": rows}, f, indent=2)
+    logger.info(f"Batch report written to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
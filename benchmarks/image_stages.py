@@ -0,0 +1,230 @@
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import PIL
+from PIL import Image, ImageDraw
+from config import settings
+
+SIZES_MP = [1, 4, 12, 48]
+# Cutouts for the sample photos are made by the local backend, so every stage sees real alpha edges
+SAMPLES = [
+    ("paid", "test_images/paid.jpg"),
+    ("unpaid", "test_images/unpaid.jpg"),
+]
+
+
+def _stage_decode(original_bytes, cutout_bytes):
+    from services.image_service import ImageService
+    ImageService._decode_rgba(cutout_bytes)
+    # Decoding produces nothing to upload
+    return 0
+
+
+def _stage_black_and_white(original_bytes, cutout_bytes):
+    from services.image_service import ImageService
+    return len(ImageService.convert_to_black_and_white(cutout_bytes))
+
+
+def _stage_watermark(original_bytes, cutout_bytes):
+    from services.image_service import ImageService
+    return len(ImageService.add_watermarks(cutout_bytes))
+
+
+def _stage_encode_clean(original_bytes, cutout_bytes):
+    from services.image_encoding import encode_image
+    from services.image_service import ImageService
+    return len(encode_image(ImageService._decode_rgba(cutout_bytes), settings.clean_encoder_profile))
+
+
+def _stage_encode_preview(original_bytes, cutout_bytes):
+    from services.image_encoding import encode_image
+    from services.image_service import ImageService
+    return len(encode_image(ImageService._decode_rgba(cutout_bytes), settings.preview_encoder_profile))
+
+
+def _stage_render_variants(original_bytes, cutout_bytes):
+    from services.image_service import ImageService
+    return sum(len(data) for data in ImageService.render_variants(cutout_bytes, original_bytes).values())
+
+
+def _stage_build_payload(original_bytes, cutout_bytes):
+    from services.removal_backends import OpenRouterBackend
+    return len(json.dumps(OpenRouterBackend.build_payload(original_bytes, False)))
+
+
+STAGES = {
+    "decode": _stage_decode,
+    "black_and_white": _stage_black_and_white,
+    "watermark": _stage_watermark,
+    "encode_clean": _stage_encode_clean,
+    "encode_preview": _stage_encode_preview,
+    "render_variants": _stage_render_variants,
+    "build_payload": _stage_build_payload,
+}
+
+
+def synthetic_inputs(megapixels: float) -> tuple[bytes, bytes]:
+    # Deterministic content: gradients and shapes, so results are comparable between runs and machines
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+
+    background = Image.merge("RGB", (
+        Image.linear_gradient("L").resize((width, height)),
+        Image.radial_gradient("L").resize((width, height)),
+        Image.linear_gradient("L").rotate(90).resize((width, height)),
+    ))
+    subject = Image.new("L", (width, height), 0)
+    draw = ImageDraw.Draw(subject)
+    draw.ellipse((width * 0.25, height * 0.15, width * 0.75, height * 0.9), fill=255)
+    draw.rectangle((width * 0.1, height * 0.6, width * 0.3, height * 0.95), fill=255)
+
+    original = io.BytesIO()
+    background.save(original, format="JPEG", quality=90)
+    cutout = background.copy()
+    cutout.putalpha(subject)
+    cutout_bytes = io.BytesIO()
+    cutout.save(cutout_bytes, format="PNG", compress_level=1)
+    return original.getvalue(), cutout_bytes.getvalue()
+
+
+def _rss_kb(field: str):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss() -> bool:
+    # Linux only: writing 5 to clear_refs resets VmHWM so the peak can be measured per stage
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def run_case(stage: str, input_name: str, original_path: str, cutout_path: str, repeat: int) -> dict:
+    settings.test_mode = False
+    with open(original_path, "rb") as f:
+        original_bytes = f.read()
+    with open(cutout_path, "rb") as f:
+        cutout_bytes = f.read()
+    func = STAGES[stage]
+
+    # Warm-up run loads fonts and codecs so they are not billed to the first measured run
+    func(original_bytes, cutout_bytes)
+
+    baseline = _rss_kb("VmRSS:")
+    exact_peak = _reset_peak_rss()
+    walls, cpus = [], []
+    output_bytes = 0
+    for _ in range(repeat):
+        wall_started, cpu_started = time.perf_counter(), time.process_time()
+        output_bytes = func(original_bytes, cutout_bytes)
+        walls.append(time.perf_counter() - wall_started)
+        cpus.append(time.process_time() - cpu_started)
+
+    peak = _rss_kb("VmHWM:") if exact_peak else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with Image.open(io.BytesIO(cutout_bytes)) as image:
+        width, height = image.size
+
+    return {
+        "stage": stage,
+        "input": input_name,
+        "megapixels": round(width * height / 1e6, 2),
+        "repeat": repeat,
+        "wall_seconds": statistics.median(walls),
+        "wall_seconds_min": min(walls),
+        "cpu_seconds": statistics.median(cpus),
+        "peak_rss_mb": peak / 1024 if peak else None,
+        "peak_rss_delta_mb": (peak - baseline) / 1024 if exact_peak and baseline else None,
+        "output_bytes": output_bytes,
+    }
+
+
+def prepare_inputs(workdir: str, sizes: list[float], samples: bool) -> list[tuple[str, str, str]]:
+    from services.removal_backends import LocalBackend
+
+    inputs = []
+    for name, original_path in SAMPLES if samples else []:
+        if not os.path.exists(original_path):
+            continue
+        with open(original_path, "rb") as f:
+            cutout_bytes = LocalBackend.render(f.read())
+        cutout_path = os.path.join(workdir, f"{name}_cutout.png")
+        with open(cutout_path, "wb") as f:
+            f.write(cutout_bytes)
+        inputs.append((name, original_path, cutout_path))
+    for megapixels in sizes:
+        original_bytes, cutout_bytes = synthetic_inputs(megapixels)
+        original_path = os.path.join(workdir, f"synthetic_{megapixels}mp.jpg")
+        cutout_path = os.path.join(workdir, f"synthetic_{megapixels}mp.png")
+        with open(original_path, "wb") as f:
+            f.write(original_bytes)
+        with open(cutout_path, "wb") as f:
+            f.write(cutout_bytes)
+        inputs.append((f"synthetic_{megapixels}mp", original_path, cutout_path))
+    return inputs
+
+
+def environment() -> dict:
+    return {
+        "python": sys.version.split()[0],
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "clean_encoder_profile": settings.clean_encoder_profile,
+        "preview_encoder_profile": settings.preview_encoder_profile,
+        "preview_max_dimension": settings.preview_max_dimension,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ImageService stages offline")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--sizes", nargs="*", type=float, default=SIZES_MP, help="synthetic input sizes in megapixels")
+    parser.add_argument("--no-samples", action="store_true", help="skip the files in test_images/")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        inputs = prepare_inputs(workdir, args.sizes, not args.no_samples)
+
+        print(f"{'stage':<16} {'input':<18} {'MP':>6} {'wall s':>8} {'cpu s':>8} {'peak MB':>8} {'out KB':>10}")
+        for input_name, original_path, cutout_path in inputs:
+            for stage in args.stages:
+                # A fresh process per case keeps peak memory and caches from leaking between measurements
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                    row = pool.submit(run_case, stage, input_name, original_path, cutout_path, args.repeat).result()
+                results.append(row)
+                peak = row["peak_rss_delta_mb"] if row["peak_rss_delta_mb"] is not None else row["peak_rss_mb"]
+                print(
+                    f"{row['stage']:<16} {row['input']:<18} {row['megapixels']:>6.1f} "
+                    f"{row['wall_seconds']:>8.3f} {row['cpu_seconds']:>8.3f} "
+                    f"{peak:>8.1f} {row['output_bytes'] / 1024:>10.1f}"
+                )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
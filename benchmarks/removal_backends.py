@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+import glob
+import statistics
+import time
+from services.http_client import close_http_session
+from services.image_executor import shutdown_image_executor
+from services.removal_backends import backend_configs, get_backend
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def bench_backend(name: str, images: list[bytes], concurrency: int, rounds: int) -> dict:
+    backend = get_backend(name)
+    limiter = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(image_bytes: bytes):
+        nonlocal errors
+        async with limiter:
+            started = time.perf_counter()
+            try:
+                # Straight to the backend: the result cache and single-flight layer would hide the cost
+                await backend.remove_background(image_bytes)
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(image) for _ in range(rounds) for image in images))
+    wall = time.perf_counter() - started
+
+    return {
+        "backend": name,
+        "requests": rounds * len(images),
+        "errors": errors,
+        "wall_seconds": wall,
+        "throughput_per_second": len(latencies) / wall if wall else 0.0,
+        "p50_seconds": percentile(latencies, 0.50),
+        "p95_seconds": percentile(latencies, 0.95),
+        "mean_seconds": statistics.fmean(latencies) if latencies else 0.0,
+    }
+
+
+async def run(args) -> list[dict]:
+    paths = args.paths or sorted(glob.glob("test_images/*.jpg"))
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+
+    results = []
+    try:
+        for name in args.backends:
+            results.append(await bench_backend(name, images, args.concurrency, args.rounds))
+    finally:
+        await close_http_session()
+        shutdown_image_executor()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare background removal backends")
+    parser.add_argument("paths", nargs="*", help="input images (default: test_images/*.jpg)")
+    parser.add_argument(
+        "--backends", nargs="+", default=["local", "openrouter"],
+        help=f"configured backend names ({', '.join(sorted(backend_configs()))})"
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'backend':<12} {'reqs':>5} {'err':>4} {'p50 s':>8} {'p95 s':>8} {'mean s':>8} {'req/s':>8}")
+    for row in asyncio.run(run(args)):
+        print(
+            f"{row['backend']:<12} {row['requests']:>5} {row['errors']:>4} "
+            f"{row['p50_seconds']:>8.3f} {row['p95_seconds']:>8.3f} "
+            f"{row['mean_seconds']:>8.3f} {row['throughput_per_second']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
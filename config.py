@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 import os
 from dotenv import load_dotenv
 import re
@@ -22,11 +22,95 @@ class Settings(BaseSettings):
     success_redirect_url: str = "https://verdant-shortbread-de4552.netlify.app/"
 
     storage_channel_id: int = -1003205665394
+
+    openrouter_timeout: int = 60
+    openrouter_pool_size: int = 64
+    openrouter_keepalive_timeout: int = 60
+    openrouter_max_in_flight: int = 32
+    openrouter_upload_max_pixels: int = 4_000_000
+    openrouter_upload_max_bytes: int = 2 * 1024 * 1024
+    openrouter_upload_format: str = "JPEG"
+    openrouter_upload_quality: int = 90
+
+    removal_backend: str = "openrouter"
+    removal_backend_configs: List[dict] = []
+    standard_backend_pool: List[str] = []
+    improved_backend_pool: List[str] = []
+    removal_use_stand_ins: bool = False
+    router_ewma_alpha: float = 0.2
+    router_latency_weight: float = 1.0
+    router_error_weight: float = 30.0
+    router_cost_weight: float = 100.0
+    router_error_half_life_seconds: float = 300.0
+    removal_fallback_backend: str = ""
+    removal_fallback_on_saturation: bool = False
+    breaker_window_seconds: int = 120
+    breaker_min_requests: int = 10
+    breaker_error_rate: float = 0.5
+    breaker_slow_call_seconds: float = 45.0
+    breaker_slow_rate: float = 0.8
+    breaker_open_seconds: int = 30
+    breaker_half_open_probes: int = 2
+    hedge_enabled: bool = False
+    hedge_backends: List[str] = ["openrouter"]
+    hedge_min_samples: int = 20
+    hedge_min_delay_seconds: float = 5.0
+
+    local_segmentation_size: int = 1024
+    local_connectivity_size: int = 256
+    local_segmentation_threshold: int = 24
+    local_segmentation_softness: int = 40
+
+    result_cache_enabled: bool = True
+    result_cache_dir: str = ".cache/results"
+    result_cache_max_bytes: int = 512 * 1024 * 1024
+    result_cache_redis_enabled: bool = False
+    result_cache_redis_prefix: str = "bgcache:"
+    result_cache_redis_ttl_seconds: int = 7 * 24 * 3600
+
+    perceptual_dedup_enabled: bool = True
+    perceptual_dedup_global: bool = False
+    perceptual_dedup_max_distance: int = 4
+    perceptual_color_max_delta: float = 10.0
+    perceptual_index_per_user: int = 50
+    perceptual_index_global: int = 5000
+
+    max_input_bytes: int = 20 * 1024 * 1024
+    max_input_pixels: int = 50_000_000
+    max_working_pixels: int = 16_000_000
+    input_downsample_quality: int = 95
+
+    image_executor_mode: str = "process"
+    image_executor_workers: int = 0
+    image_shm_threshold_bytes: int = 1024 * 1024
+
+    watermark_overlay_cache_size: int = 4
+
+    full_resolution_output: bool = True
+    mask_feather_radius: float = 0.5
+    mask_aspect_tolerance: float = 0.02
+    improved_mode: str = "local"
+    improved_band_divisor: int = 250
+    alpha_repair_enabled: bool = True
+    alpha_min_transparent_ratio: float = 0.01
+    alpha_flat_border_min_ratio: float = 0.9
+    autocrop_enabled: bool = False
+    autocrop_padding: int = 16
+    autocrop_alpha_threshold: int = 8
+
+    clean_encoder_profile: str = "png"
+    preview_encoder_profile: str = "png_palette"
+    preview_max_dimension: int = 1280
+    export_pack_enabled: bool = True
+    export_pack_formats: List[str] = ["sticker", "white_jpeg", "avatar"]
+    # Per-format overrides of size, crop, background or encoder params, e.g. {"avatar": {"size": 1024}}
+    export_pack_overrides: Dict[str, dict] = {}
     
     test_mode: bool = False  
     test_paid_image_path: str = "test_images/paid.jpg"
     test_unpaid_image_path: str = "test_images/unpaid.jpg"
     test_transparent_image_path: str = "test_images/transparent.png"
+    test_transparent_image_path_improved: str = "test_images/transparent.png"
     test_bw_image_path: str = "test_images/bw.png"
     
     discount_290_minutes: int = 1
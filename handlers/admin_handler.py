@@ -4,6 +4,11 @@ from aiogram.types import Message
 from database.connection import get_async_session
 from repositories.user_repository import UserRepository
 from config import settings
+from services.result_cache import ResultCache
+from services.circuit_breaker import all_breakers
+from services.image_service import ImageService
+from services.backend_router import get_router
+from utils import metrics
 from utils.logger import logger
 
 router = Router()
@@ -18,12 +23,47 @@ async def admin_handler(message: Message):
         user_repo = UserRepository(session)
         stats = await user_repo.get_stats()
 
+    cache_stats = ResultCache.stats()
+    breaker_lines = ""
+    for name, breaker in all_breakers().items():
+        b = breaker.stats()
+        breaker_lines += (
+            f"• {name}: {b['state']}, p50 {b['p50_seconds']:.1f} с, "
+            f"p95 {b['p95_seconds']:.1f} с, p99 {b['p99_seconds']:.1f} с\n"
+        )
+    if not breaker_lines:
+        breaker_lines = "• нет данных\n"
+
+    router_lines = ""
+    for name, r in get_router().stats().items():
+        router_lines += (
+            f"• {name}: задержка {r['latency_ewma']:.1f} с, ошибки {r['error_rate_ewma']:.0%}, "
+            f"в работе {r['in_flight']}, замеров {r['samples']}\n"
+        )
+    if not router_lines:
+        router_lines = "• нет данных\n"
+
+    # Raw counters since start: single-flight leaders/waiters, near-duplicate hits, hedges and breaker events
+    counter_lines = f"• remove_background.single_flight.in_flight: {ImageService.removals_in_flight()}\n"
+    for name, value in metrics.snapshot().items():
+        counter_lines += f"• {name}: {value:g}\n"
+
     stats_text = f"""
 📊 Статистика бота:
 
 • Новых пользователей сегодня: {stats['new_today']}
 • Новых пользователей вчера: {stats['new_yesterday']}
 • Всего пользователей: {stats['total']}
-    """
+
+🗂 Кэш обработок:
+• Попаданий: {cache_stats['hits']} / промахов: {cache_stats['misses']} ({cache_stats['hit_rate']:.0%})
+• Сэкономлено запросов к API: {cache_stats['api_calls_saved']} (~{cache_stats['seconds_saved']:.0f} с)
+
+🛡 Сервисы удаления фона:
+{breaker_lines}
+🔀 Маршрутизация:
+{router_lines}
+📈 Счётчики:
+{counter_lines}    """
     await message.answer(stats_text)
     logger.info(f"Admin stats requested by {message.from_user.id}")
\ No newline at end of file
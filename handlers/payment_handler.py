@@ -1,11 +1,14 @@
 from aiogram import Router, F
-from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.types import BufferedInputFile, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.fsm.context import FSMContext
 from services.payment_service import PaymentService
 from services.telegram_storage import TelegramStorage
-from keyboards.inline_keyboards import get_payment_keyboard, get_paid_keyboard
+from services.image_executor import run_image_job
+from services.export_pack import export_spec, render_export_pack
+from keyboards.inline_keyboards import get_payment_keyboard, get_paid_keyboard, get_export_keyboard
 from database.connection import get_async_session
 from repositories.image_repositories import ImageRepository
+from repositories.user_repository import UserRepository
 from config import settings
 from utils.logger import logger
 import asyncio
@@ -18,6 +21,8 @@ async def send_all_versions_from_storage(
     bot, telegram_id: int, image_key: str, db_image
 ):
 
+    export_markup = get_export_keyboard(image_key) if settings.export_pack_enabled else None
+
     try:
         if db_image.standard_transparent_file_id:
             await TelegramStorage.send_from_storage(
@@ -44,12 +49,14 @@ async def send_all_versions_from_storage(
             
             await bot.send_message(
                 telegram_id,
-                "🎉 Спасибо за оплату! Вы получили все 4 версии вашей фотографии!"
+                "🎉 Спасибо за оплату! Вы получили все 4 версии вашей фотографии!",
+                reply_markup=export_markup
             )
         else:
             await bot.send_message(
                 telegram_id,
-                "✅ Спасибо за оплату! Вы получили 2 версии вашей фотографии!"
+                "✅ Спасибо за оплату! Вы получили 2 версии вашей фотографии!",
+                reply_markup=export_markup
             )
         
         logger.info(f"✅ Successfully sent all versions for {image_key}")
@@ -273,6 +280,44 @@ async def poll_for_payment(
         logger.error(f"Failed to update expired invoice: {e}")
 
 
+@router.callback_query(F.data.startswith("export_"))
+async def export_pack_handler(callback: CallbackQuery):
+    image_key = callback.data[len("export_"):]
+
+    async for session in get_async_session():
+        image_repo = ImageRepository(session)
+        user_repo = UserRepository(session)
+        db_image = await image_repo.get_by_key(image_key)
+        user = await user_repo.get_or_create(callback.from_user.id)
+
+    if not db_image or not db_image.is_paid or db_image.user_id != user.id:
+        await callback.answer("❌ Изображение не найдено!", show_alert=True)
+        return
+
+    # The pack is rendered from the best clean cutout already in storage; the pipeline is not re-run
+    file_id = db_image.improved_transparent_file_id or db_image.standard_transparent_file_id
+    if not file_id:
+        await callback.answer("❌ Изображение не найдено!", show_alert=True)
+        return
+
+    await callback.answer("⏳ Готовлю дополнительные форматы...")
+    try:
+        cutout_bytes = await TelegramStorage.download(callback.bot, file_id)
+        pack = await run_image_job(render_export_pack, cutout_bytes)
+
+        for name, data in pack.items():
+            spec = export_spec(name)
+            await callback.message.answer_document(
+                document=BufferedInputFile(data, filename=f"{name}_{image_key}.{spec['extension']}"),
+                caption=spec["caption"]
+            )
+        logger.info(f"✅ Export pack sent for {image_key}")
+
+    except Exception as e:
+        logger.error(f"Failed to send export pack for {image_key}: {e}")
+        await callback.message.answer("❌ Не удалось подготовить файлы. Попробуйте позже.")
+
+
 @router.callback_query(F.data == "not_like")
 async def not_like_handler(callback: CallbackQuery):
     await callback.message.answer(
@@ -5,9 +5,12 @@ from aiogram.types import Message, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 from services.image_service import ImageService
 from services.telegram_storage import TelegramStorage
+from services.image_executor import run_image_job, share_image_bytes
+from services.image_encoding import preview_extension
+from services.perceptual_index import compute_fingerprint, get_perceptual_index
 from keyboards.inline_keyboards import get_result_keyboard
 from utils.file_utils import download_temp_file, cleanup_file, cleanup_temp_dir
-from photos.processor import validate_image_bytes, is_valid_image_file
+from photos.processor import ImageTooLargeError, InvalidImageError, prepare_image, is_valid_image_file
 from config import settings
 from utils.logger import logger
 from database.connection import get_async_session
@@ -19,19 +22,59 @@ router = Router()
 user_queues = {}
 user_locks = {}
 
+TOO_LARGE_MESSAGE = "❌ Изображение слишком большое. Отправьте файл поменьше."
+
 async def process_image_with_retry(original_bytes, retries=2, improved=False):
     last_exception = None
     for attempt in range(1, retries + 1):
         try:
-            transparent_bytes = ImageService.remove_background(original_bytes, improved=improved)
-            bw_bytes = ImageService.convert_to_black_and_white(transparent_bytes)
-            return transparent_bytes, bw_bytes
+            transparent_bytes = await ImageService.remove_background_async(original_bytes, improved=improved)
+            return await run_image_job(ImageService.render_variants, transparent_bytes, original_bytes)
         except Exception as e:
             last_exception = e
             await asyncio.sleep(1)
     raise last_exception
 
 
+async def compute_image_fingerprint(original_bytes: bytes):
+    if not settings.perceptual_dedup_enabled:
+        return None
+    try:
+        return await run_image_job(compute_fingerprint, original_bytes)
+    except Exception as e:
+        logger.warning(f"Perceptual hash failed: {e}")
+        return None
+
+
+async def find_near_duplicate(fingerprint, user_id: int):
+    if fingerprint is None:
+        return None
+    
+    index = get_perceptual_index()
+    perceptual_hash, color = fingerprint
+    match_key = index.find(perceptual_hash, color, user_id, settings.perceptual_dedup_max_distance)
+    if match_key is None:
+        return None
+    
+    async for session in get_async_session():
+        image_repo = ImageRepository(session)
+        db_image = await image_repo.get_by_key(match_key)
+    
+    # The original is never copied from the match: each upload keeps its own
+    file_ids = {
+        'standard_transparent_file_id': db_image.standard_transparent_file_id if db_image else None,
+        'standard_bw_file_id': db_image.standard_bw_file_id if db_image else None,
+        'watermarked_transparent_file_id': db_image.watermarked_transparent_file_id if db_image else None,
+        'watermarked_bw_file_id': db_image.watermarked_bw_file_id if db_image else None
+    }
+    if not all(file_ids.values()):
+        index.discard(match_key)
+        return None
+    
+    logger.info(f"🔁 Near-duplicate of {match_key} found for user {user_id}")
+    return file_ids
+
+
 async def check_spam_limit(user_id: int) -> tuple[bool, bool]:
     async for session in get_async_session():
         image_repo = ImageRepository(session)
@@ -67,25 +110,33 @@ async def process_and_send_images(
     image_key = str(uuid.uuid4())
     logger.info(f"🔑 User {user_id}: Generated key {image_key}")
     
-    logger.info(f"🎨 Processing standard versions for {image_key}")
-    transparent_bytes, bw_bytes = await process_image_with_retry(
-        original_bytes, retries=2, improved=False
-    )
+    fingerprint = await compute_image_fingerprint(original_bytes)
+    file_ids = await find_near_duplicate(fingerprint, user_id)
     
-    logger.info(f"💧 Adding watermarks for {image_key}")
-    transparent_watermarked = ImageService.add_watermarks(transparent_bytes)
-    bw_watermarked = ImageService.add_watermarks(bw_bytes)
-    
-    logger.info(f"📤 Uploading to channel for {image_key}")
-    file_ids = await TelegramStorage.upload_standard_versions(
-        bot=message.bot,
-        original_bytes=original_bytes,
-        transparent_bytes=transparent_bytes,
-        bw_bytes=bw_bytes,
-        transparent_watermarked=transparent_watermarked,
-        bw_watermarked=bw_watermarked,
-        image_key=image_key
-    )
+    if file_ids:
+        logger.info(f"♻️ Reusing near-duplicate result for {image_key}")
+        file_ids['original_file_id'] = await TelegramStorage.upload_original(message.bot, original_bytes, image_key)
+        preview_transparent = file_ids['watermarked_transparent_file_id']
+        preview_bw = file_ids['watermarked_bw_file_id']
+    else:
+        logger.info(f"🎨 Processing standard versions for {image_key}")
+        variants = await process_image_with_retry(
+            original_bytes, retries=2, improved=False
+        )
+        
+        logger.info(f"📤 Uploading to channel for {image_key}")
+        file_ids = await TelegramStorage.upload_standard_versions(
+            bot=message.bot,
+            original_bytes=original_bytes,
+            image_key=image_key,
+            **variants
+        )
+        preview_transparent = BufferedInputFile(
+            variants['transparent_watermarked'], filename=f"transparent_watermarked.{preview_extension()}"
+        )
+        preview_bw = BufferedInputFile(
+            variants['bw_watermarked'], filename=f"bw_watermarked.{preview_extension()}"
+        )
     
     async for session in get_async_session():
         image_repo = ImageRepository(session)
@@ -102,20 +153,21 @@ async def process_and_send_images(
             watermarked_bw_file_id=file_ids['watermarked_bw_file_id']
         )
     
+    if fingerprint is not None:
+        get_perceptual_index().add(*fingerprint, user_id, image_key)
+    
     logger.info(f"📨 Sending watermarked previews to user {user_id}")
     
     markup = get_result_keyboard(user_id, image_key, settings.price)
     
-    doc1 = BufferedInputFile(transparent_watermarked, filename=f"transparent_watermarked.png")
     msg1 = await message.answer_document(
-        document=doc1,
+        document=preview_transparent,
         caption="1️⃣ Прозрачный фон (с водяными знаками)",
         reply_to_message_id=message.message_id
     )
     
-    doc2 = BufferedInputFile(bw_watermarked, filename=f"bw_watermarked.png")
     msg2 = await message.answer_document(
-        document=doc2,
+        document=preview_bw,
         caption="2️⃣ Черно-белая (с водяными знаками)"
     )
     
@@ -158,12 +210,14 @@ async def process_queue(user_id: int):
         task = user_queues[user_id][0]
         
         try:
-            await task['func'](
-                task['message'],
-                task['state'],
-                task['original_bytes'],
-                task['user_id']
-            )
+            # One shared-memory copy of the upload serves the hash, payload and render jobs
+            with share_image_bytes(task['original_bytes']):
+                await task['func'](
+                    task['message'],
+                    task['state'],
+                    task['original_bytes'],
+                    task['user_id']
+                )
         except Exception as e:
             logger.exception(f"Error processing queued image for user {user_id}: {e}")
             try:
@@ -223,14 +277,19 @@ async def photo_handler(message: Message, state: FSMContext):
         with open(temp_path, "rb") as f:
             original_bytes = f.read()
 
-        if not validate_image_bytes(original_bytes):
-            await message.answer("❌ Неверный формат фото.")
+        try:
+            original_bytes = await run_image_job(prepare_image, original_bytes)
+        except InvalidImageError as e:
+            logger.warning(f"Rejected input from user {user_id}: {e}")
+            if isinstance(e, ImageTooLargeError):
+                await message.answer(TOO_LARGE_MESSAGE)
+            else:
+                await message.answer("❌ Неверный формат фото.")
             cleanup_file(temp_path)
             if temp_dir:
                 cleanup_temp_dir(temp_dir)
             return
 
-
         await add_to_queue(message, state, original_bytes, user_id, temp_path, temp_dir)
 
     except Exception as e:
@@ -257,20 +316,29 @@ async def document_handler(message: Message, state: FSMContext):
             await message.answer("❌ Файл не является изображением.")
             return
 
+        if document.file_size and document.file_size > settings.max_input_bytes:
+            await message.answer(TOO_LARGE_MESSAGE)
+            return
+
         file = await message.bot.get_file(document.file_id)
         temp_path, temp_dir = await download_temp_file(message.bot, file.file_path, user_id)
 
         with open(temp_path, "rb") as f:
             original_bytes = f.read()
 
-        if not validate_image_bytes(original_bytes):
-            await message.answer("❌ Неверный формат файла.")
+        try:
+            original_bytes = await run_image_job(prepare_image, original_bytes)
+        except InvalidImageError as e:
+            logger.warning(f"Rejected input from user {user_id}: {e}")
+            if isinstance(e, ImageTooLargeError):
+                await message.answer(TOO_LARGE_MESSAGE)
+            else:
+                await message.answer("❌ Неверный формат файла.")
             cleanup_file(temp_path)
             if temp_dir:
                 cleanup_temp_dir(temp_dir)
             return
 
-
         await add_to_queue(message, state, original_bytes, user_id, temp_path, temp_dir)
 
     except Exception as e:
@@ -24,4 +24,9 @@ def get_paid_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="✅ Оплата прошла", callback_data="paid_done")],
         [InlineKeyboardButton(text="Не нравится результат", callback_data="not_like")]
-    ])
\ No newline at end of file
+    ])
+
+def get_export_keyboard(image_key: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📦 Дополнительные форматы", callback_data=f"export_{image_key}")]
+    ])
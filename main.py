@@ -8,6 +8,9 @@ from config import settings
 from handlers import start_router, photo_router, payment_router, admin_router
 from middlewares.logging_middleware import LoggingMiddleware
 from database.connection import init_db
+from services.http_client import close_http_session
+from services.result_cache import close_result_cache
+from services.image_executor import shutdown_image_executor
 from utils.logger import logger
 
 async def main():
@@ -23,7 +26,12 @@ async def main():
     dp.include_router(admin_router)
 
     logger.info("Starting bot polling...")
-    await dp.start_polling(bot, skip_updates=True)
+    try:
+        await dp.start_polling(bot, skip_updates=True)
+    finally:
+        await close_http_session()
+        await close_result_cache()
+        shutdown_image_executor()
 
 if __name__ == "__main__":
     try:
@@ -1,16 +1,95 @@
 import io
 from typing import Optional
-from PIL import Image
+from PIL import Image, ImageOps
+from config import settings
 from utils.logger import logger
+from services.image_encoding import fit_pixel_budget
 
-def validate_image_bytes(image_bytes: bytes) -> bool:
+# Pillow raises DecompressionBombError past twice this limit, before allocating any pixels
+Image.MAX_IMAGE_PIXELS = settings.max_input_pixels
+
+
+SUPPORTED_FORMATS = {"JPEG", "MPO", "PNG", "WEBP", "BMP", "TIFF", "GIF", "ICO"}
+
+# Formats whose completeness can be checked from the trailing bytes without decoding
+END_MARKERS = {
+    "JPEG": b"\xff\xd9",
+    "MPO": b"\xff\xd9",
+    "PNG": b"IEND\xaeB`\x82",
+}
+
+EXIF_ORIENTATION = 0x0112
+
+
+class InvalidImageError(ValueError):
+    pass
+
+
+class ImageTooLargeError(InvalidImageError):
+    pass
+
+
+def _is_complete(image_bytes: bytes, image_format: str) -> bool:
+    marker = END_MARKERS.get(image_format)
+    return marker is not None and image_bytes.rstrip(b"\x00\r\n ").endswith(marker)
+
+
+def _orientation(image: Image.Image) -> int:
+    # PNG getexif() decodes the whole file looking for a late eXIf chunk; header-only EXIF is enough here
+    if image.format == "PNG" and "exif" not in image.info:
+        return 1
+    try:
+        return image.getexif().get(EXIF_ORIENTATION, 1)
+    except Exception:
+        return 1
+
+
+def prepare_image(image_bytes: bytes) -> bytes:
+    if len(image_bytes) > settings.max_input_bytes:
+        raise ImageTooLargeError(f"{len(image_bytes)} bytes exceeds {settings.max_input_bytes}")
+
+    # Header probe: format and dimensions are known before any pixel is decoded
     try:
-        img = Image.open(io.BytesIO(image_bytes))
-        img.verify()
-        return True
+        image = Image.open(io.BytesIO(image_bytes))
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e))
     except Exception as e:
-        return False
-    
+        raise InvalidImageError(f"unreadable image: {e}")
+
+    image_format = image.format
+    if image_format not in SUPPORTED_FORMATS:
+        raise InvalidImageError(f"unsupported format {image_format}")
+
+    width, height = image.size
+    if width * height > settings.max_input_pixels:
+        raise ImageTooLargeError(f"{width}x{height} exceeds {settings.max_input_pixels} pixels")
+
+    oversized = width * height > settings.max_working_pixels
+    rotated = _orientation(image) != 1
+    if not oversized and not rotated and _is_complete(image_bytes, image_format):
+        return image_bytes
+
+    # Single decode: downsample, apply orientation and re-encode so later stages get upright pixels
+    try:
+        # An oversized JPEG is decoded straight at a reduced draft scale, so the full image is never in memory
+        image = fit_pixel_budget(image, settings.max_working_pixels)
+        image.load()
+    except Exception as e:
+        raise InvalidImageError(f"truncated or corrupt image: {e}")
+    image = ImageOps.exif_transpose(image)
+
+    buffered = io.BytesIO()
+    if "A" in image.getbands() or "transparency" in image.info:
+        image.convert("RGBA").save(buffered, format="PNG", compress_level=1)
+    else:
+        image.convert("RGB").save(buffered, format="JPEG", quality=settings.input_downsample_quality)
+    logger.info(
+        f"Input normalized: {image_format} {width}x{height} -> {image.size[0]}x{image.size[1]}, "
+        f"{len(image_bytes) / 1024:.1f} KB -> {buffered.tell() / 1024:.1f} KB"
+    )
+    return buffered.getvalue()
+
+
 def is_valid_image_file(filename: Optional[str], mime_type: Optional[str]) -> bool:
     valid_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tiff', '.tif'}
     
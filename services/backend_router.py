@@ -0,0 +1,140 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Iterable, Optional
+from config import settings
+from utils import metrics
+from utils.logger import logger
+from services.circuit_breaker import get_breaker
+from services.removal_backends import RemovalBackend, TestImageBackend, get_backend
+
+
+class BackendStats:
+    def __init__(self):
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.samples = 0
+        self.updated = 0.0
+        self.in_flight = 0
+        self.limiter: Optional[asyncio.Semaphore] = None
+        self.limiter_loop = None
+
+    def current_error_rate(self) -> float:
+        # Errors fade while a backend gets no traffic, otherwise one bad burst would starve it for good
+        if not self.samples or settings.router_error_half_life_seconds <= 0:
+            return self.error_rate
+        idle = time.monotonic() - self.updated
+        return self.error_rate * 0.5 ** (idle / settings.router_error_half_life_seconds)
+
+    def record(self, latency: float, ok: bool):
+        alpha = settings.router_ewma_alpha
+        if self.samples == 0:
+            self.latency = latency
+            self.error_rate = 0.0 if ok else 1.0
+        else:
+            self.latency += alpha * (latency - self.latency)
+            self.error_rate = self.current_error_rate()
+            self.error_rate += alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        self.samples += 1
+        self.updated = time.monotonic()
+
+
+class BackendRouter:
+    def __init__(self):
+        self._stats: dict[str, BackendStats] = {}
+
+    def _get_stats(self, name: str) -> BackendStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = BackendStats()
+        return stats
+
+    def pool(self, improved: bool) -> list[str]:
+        if settings.test_mode:
+            return [TestImageBackend.kind]
+        names = settings.improved_backend_pool if improved else settings.standard_backend_pool
+        return list(names) or [settings.removal_backend]
+
+    def score(self, backend: RemovalBackend) -> float:
+        stats = self._get_stats(backend.name)
+        # Backends without samples only pay their cost, so each one gets tried before the EWMA takes over
+        return (
+            stats.latency * settings.router_latency_weight
+            + stats.current_error_rate() * settings.router_error_weight
+            + backend.cost * settings.router_cost_weight
+        )
+
+    def is_full(self, backend: RemovalBackend) -> bool:
+        if backend.is_saturated():
+            return True
+        return bool(backend.max_concurrency) and self._get_stats(backend.name).in_flight >= backend.max_concurrency
+
+    def choose(self, improved: bool, exclude: Iterable[str] = (), use_fallback: bool = False) -> Optional[RemovalBackend]:
+        names = [name for name in self.pool(improved) if name not in exclude]
+        if use_fallback and settings.removal_fallback_backend and settings.removal_fallback_backend not in exclude:
+            names.append(settings.removal_fallback_backend)
+
+        candidates = [get_backend(name) for name in dict.fromkeys(names)]
+        candidates = [backend for backend in candidates if not get_breaker(backend.name).is_open()]
+        if not candidates:
+            return None
+
+        available = [backend for backend in candidates if not self.is_full(backend)]
+        if not available and settings.removal_fallback_on_saturation and not use_fallback:
+            return self.choose(improved, exclude, use_fallback=True)
+
+        chosen = min(available or candidates, key=self.score)
+        metrics.incr(f"router.chosen.{chosen.name}")
+        return chosen
+
+    @asynccontextmanager
+    async def slot(self, backend: RemovalBackend):
+        stats = self._get_stats(backend.name)
+        limiter = None
+        if backend.max_concurrency:
+            loop = asyncio.get_running_loop()
+            if stats.limiter is None or stats.limiter_loop is not loop:
+                stats.limiter = asyncio.Semaphore(backend.max_concurrency)
+                stats.limiter_loop = loop
+            limiter = stats.limiter
+
+        if limiter is not None:
+            await limiter.acquire()
+        stats.in_flight += 1
+        try:
+            yield
+        finally:
+            stats.in_flight -= 1
+            if limiter is not None:
+                limiter.release()
+
+    def record(self, backend: RemovalBackend, latency: float, ok: bool):
+        self._get_stats(backend.name).record(latency, ok)
+        if ok and backend.cost:
+            metrics.incr(f"remove_background.{backend.name}.cost", backend.cost)
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "latency_ewma": stats.latency,
+                "error_rate_ewma": stats.current_error_rate(),
+                "samples": stats.samples,
+                "in_flight": stats.in_flight,
+            }
+            for name, stats in self._stats.items()
+        }
+
+
+_router: Optional[BackendRouter] = None
+
+
+def get_router() -> BackendRouter:
+    global _router
+
+    if _router is None:
+        _router = BackendRouter()
+        logger.info(
+            f"Backend router: standard={_router.pool(False)}, improved={_router.pool(True)}, "
+            f"fallback={settings.removal_fallback_backend or '-'}"
+        )
+    return _router
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+from config import settings
+from utils import metrics
+from utils.logger import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self._outcomes: deque = deque()
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        horizon = now - settings.breaker_window_seconds
+        while self._outcomes and self._outcomes[0][0] < horizon:
+            self._outcomes.popleft()
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        logger.warning(f"Circuit {self.name}: {self.state} -> {state}")
+        self.state = state
+        self._probes = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        elif state == CLOSED:
+            # The failures that opened the circuit are still inside the window and would reopen it at once
+            self._outcomes.clear()
+        metrics.incr(f"circuit.{self.name}.transitions.{state}")
+
+    def is_open(self) -> bool:
+        return self.state == OPEN and time.monotonic() - self._opened_at < settings.breaker_open_seconds
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < settings.breaker_open_seconds:
+                    metrics.incr(f"circuit.{self.name}.rejected")
+                    return False
+                self._transition(HALF_OPEN)
+
+            if self.state == HALF_OPEN:
+                if self._probes >= settings.breaker_half_open_probes:
+                    metrics.incr(f"circuit.{self.name}.rejected")
+                    return False
+                self._probes += 1
+
+            metrics.incr(f"circuit.{self.name}.allowed.{self.state}")
+            return True
+
+    def release_probe(self):
+        # A probe that ended without an outcome (cancelled) must give its slot back
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record(self, ok: bool, latency: float):
+        now = time.monotonic()
+        with self._lock:
+            self._outcomes.append((now, ok, latency))
+            self._trim(now)
+            metrics.incr(f"circuit.{self.name}.{'successes' if ok else 'failures'}")
+
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED if ok else OPEN)
+                return
+
+            total = len(self._outcomes)
+            if self.state != CLOSED or total < settings.breaker_min_requests:
+                return
+            errors = sum(1 for _, success, _ in self._outcomes if not success)
+            slow = sum(1 for _, _, took in self._outcomes if took >= settings.breaker_slow_call_seconds)
+            if errors / total >= settings.breaker_error_rate or slow / total >= settings.breaker_slow_rate:
+                self._transition(OPEN)
+
+    def latencies(self) -> list[float]:
+        with self._lock:
+            self._trim(time.monotonic())
+            return [took for _, ok, took in self._outcomes if ok]
+
+    def stats(self) -> dict:
+        latencies = self.latencies()
+        return {
+            "state": self.state,
+            "samples": len(latencies),
+            "p50_seconds": percentile(latencies, 0.50),
+            "p95_seconds": percentile(latencies, 0.95),
+            "p99_seconds": percentile(latencies, 0.99),
+        }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+def all_breakers() -> dict[str, CircuitBreaker]:
+    return dict(_breakers)
+
+
+def _hedge_delay(breaker: CircuitBreaker) -> Optional[float]:
+    latencies = breaker.latencies()
+    if len(latencies) < settings.hedge_min_samples:
+        return None
+    return max(settings.hedge_min_delay_seconds, percentile(latencies, 0.95))
+
+
+async def _hedged(breaker: CircuitBreaker, func: Callable[[], Awaitable], delay: float):
+    first = asyncio.ensure_future(func())
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+
+    metrics.incr(f"circuit.{breaker.name}.hedges")
+    second = asyncio.ensure_future(func())
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        metrics.incr(f"circuit.{breaker.name}.hedge_wins")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call_with_breaker(name: str, func: Callable[[], Awaitable], hedge: bool = False):
+    breaker = get_breaker(name)
+    if not breaker.allow():
+        raise CircuitOpenError(f"Circuit for {name} is open")
+
+    probe = breaker.state == HALF_OPEN
+    delay = _hedge_delay(breaker) if hedge else None
+    started = time.perf_counter()
+    try:
+        result = await (_hedged(breaker, func, delay) if delay is not None else func())
+    except asyncio.CancelledError:
+        if probe:
+            breaker.release_probe()
+        raise
+    except Exception:
+        breaker.record(False, time.perf_counter() - started)
+        raise
+
+    breaker.record(True, time.perf_counter() - started)
+    return result
@@ -0,0 +1,131 @@
+import io
+from PIL import Image
+from config import settings
+from utils.logger import logger
+from services.matting import alpha_bbox
+
+EXPORT_FORMATS = {
+    "sticker": {
+        "caption": "🏷 Стикер 512px (WebP)",
+        "extension": "webp",
+        "format": "WEBP",
+        "params": {"quality": 90, "method": 4},
+        "size": 512,
+        "crop": "subject",
+        "background": None,
+    },
+    "white_jpeg": {
+        "caption": "🖼 JPEG на белом фоне",
+        "extension": "jpg",
+        "format": "JPEG",
+        "params": {"quality": 92},
+        "size": 0,
+        "crop": None,
+        "background": (255, 255, 255),
+    },
+    "avatar": {
+        "caption": "👤 Квадратный аватар",
+        "extension": "jpg",
+        "format": "JPEG",
+        "params": {"quality": 92},
+        "size": 640,
+        "crop": "square",
+        "background": (255, 255, 255),
+    },
+}
+
+
+def _crop_box(image: Image.Image, crop: str, subject: tuple[int, int, int, int]) -> tuple[int, int, int, int]:
+    if crop is None or subject is None:
+        return 0, 0, *image.size
+    if crop == "subject":
+        return subject
+
+    # Square centred on the subject; it may reach past the image edges, which crop() fills as transparent
+    left, top, right, bottom = subject
+    side = max(right - left, bottom - top)
+    center_x = (left + right) // 2
+    center_y = (top + bottom) // 2
+    return center_x - side // 2, center_y - side // 2, center_x - side // 2 + side, center_y - side // 2 + side
+
+
+class _Downscales:
+    # Every export reads from the smallest already computed downscale that still has enough pixels
+    def __init__(self, image: Image.Image):
+        self.levels = [(1.0, image)]
+
+    def get(self, scale: float) -> tuple[float, Image.Image]:
+        if scale >= 1.0:
+            return self.levels[0]
+
+        source_scale, source = min((level for level in self.levels if level[0] >= scale), key=lambda level: level[0])
+        if source_scale == scale:
+            return source_scale, source
+
+        width, height = self.levels[0][1].size
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        scaled = source.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        self.levels.append((scale, scaled))
+        return scale, scaled
+
+
+def _render(downscales: _Downscales, spec: dict, subject) -> Image.Image:
+    full = downscales.levels[0][1]
+    box = _crop_box(full, spec["crop"], subject)
+    box_width, box_height = box[2] - box[0], box[3] - box[1]
+
+    scale = 1.0
+    if spec["size"] and max(box_width, box_height) > spec["size"]:
+        scale = spec["size"] / max(box_width, box_height)
+    scale, source = downscales.get(scale)
+
+    scaled_box = tuple(round(v * scale) for v in box)
+    image = source.crop(scaled_box)
+    if spec["size"]:
+        target = spec["size"] / max(image.size)
+        if target != 1.0:
+            image = image.resize(
+                (max(1, round(image.size[0] * target)), max(1, round(image.size[1] * target))),
+                Image.Resampling.LANCZOS,
+            )
+
+    if spec["background"] is not None:
+        flattened = Image.new("RGB", image.size, spec["background"])
+        flattened.paste(image, mask=image.getchannel("A"))
+        return flattened
+    return image
+
+
+def export_spec(name: str) -> dict:
+    overrides = settings.export_pack_overrides.get(name, {})
+    spec = {**EXPORT_FORMATS[name], **overrides}
+    spec["params"] = {**EXPORT_FORMATS[name]["params"], **overrides.get("params", {})}
+    if spec["background"] is not None:
+        spec["background"] = tuple(spec["background"])
+    return spec
+
+
+def export_names() -> list[str]:
+    return [name for name in settings.export_pack_formats if name in EXPORT_FORMATS]
+
+
+def render_export_pack(cutout_bytes: bytes, names: list[str] = None) -> dict[str, bytes]:
+    image = Image.open(io.BytesIO(cutout_bytes)).convert("RGBA")
+    subject = alpha_bbox(image, settings.autocrop_padding)
+    downscales = _Downscales(image)
+
+    # Largest outputs first, so smaller ones can be reduced from their intermediates
+    specs = {name: export_spec(name) for name in (names or export_names()) if name in EXPORT_FORMATS}
+    names = sorted(specs, key=lambda name: specs[name]["size"] or max(image.size), reverse=True)
+
+    pack = {}
+    for name in names:
+        spec = specs[name]
+        buffered = io.BytesIO()
+        _render(downscales, spec, subject).save(buffered, format=spec["format"], **spec["params"])
+        pack[name] = buffered.getvalue()
+
+    logger.info(
+        f"Export pack rendered: {', '.join(f'{name} {len(data) / 1024:.1f} KB' for name, data in pack.items())}"
+    )
+    return pack
@@ -0,0 +1,50 @@
+import asyncio
+import aiohttp
+from typing import Optional
+from config import settings
+from utils.logger import logger
+
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+_in_flight: Optional[asyncio.Semaphore] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    global _session, _session_loop, _in_flight
+
+    loop = asyncio.get_running_loop()
+    # Celery runs every beat tick in a fresh event loop, so the pool has to follow the loop
+    if _session is None or _session.closed or _session_loop is not loop:
+        connector = aiohttp.TCPConnector(
+            limit=settings.openrouter_pool_size,
+            keepalive_timeout=settings.openrouter_keepalive_timeout,
+            ttl_dns_cache=300,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=settings.openrouter_timeout),
+        )
+        _session_loop = loop
+        _in_flight = asyncio.Semaphore(settings.openrouter_max_in_flight)
+        logger.info(
+            f"HTTP pool created (pool size {settings.openrouter_pool_size}, "
+            f"max in flight {settings.openrouter_max_in_flight})"
+        )
+
+    return _session
+
+
+def get_in_flight_limiter() -> asyncio.Semaphore:
+    get_http_session()
+    return _in_flight
+
+
+async def close_http_session():
+    global _session, _session_loop, _in_flight
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    _session_loop = None
+    _in_flight = None
+    logger.info("HTTP pool closed")
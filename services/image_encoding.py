@@ -0,0 +1,203 @@
+import io
+import math
+import sys
+import time
+from PIL import Image, ImageOps
+from PIL.PngImagePlugin import PngInfo
+from config import settings
+from utils.logger import logger
+
+ENCODER_PROFILES = {
+    "png": {"format": "PNG", "extension": "png", "params": {}},
+    "png_fast": {"format": "PNG", "extension": "png", "params": {"compress_level": 1}},
+    "png_small": {"format": "PNG", "extension": "png", "params": {"compress_level": 9, "optimize": True}},
+    "webp_lossless": {"format": "WEBP", "extension": "webp", "params": {"lossless": True, "quality": 50, "method": 2}},
+    "webp_lossless_small": {"format": "WEBP", "extension": "webp", "params": {"lossless": True, "quality": 80, "method": 4}},
+    # Lossy profiles, meant for watermarked previews only
+    "png_palette": {"format": "PNG", "extension": "png", "params": {"optimize": True}, "colors": 256},
+    "webp": {"format": "WEBP", "extension": "webp", "params": {"quality": 80, "method": 4}},
+}
+
+DEFAULT_PROFILE = "png"
+
+# Image.info entries carried into PNG text chunks (the autocrop box)
+PNG_TEXT_KEYS = {"autocrop"}
+
+UPLOAD_FORMATS = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "PNG": "image/png",
+}
+UPLOAD_MIN_QUALITY = 60
+
+
+def get_profile(name: str) -> dict:
+    profile = ENCODER_PROFILES.get(name)
+    if profile is None:
+        logger.warning(f"Unknown encoder profile {name!r}, using {DEFAULT_PROFILE}")
+        profile = ENCODER_PROFILES[DEFAULT_PROFILE]
+    return profile
+
+
+def profile_extension(name: str) -> str:
+    return get_profile(name)["extension"]
+
+
+def clean_extension() -> str:
+    return profile_extension(settings.clean_encoder_profile)
+
+
+def preview_extension() -> str:
+    return profile_extension(settings.preview_encoder_profile)
+
+
+def quantize(image: Image.Image, colors: int) -> Image.Image:
+    # Fast octree is the only built-in method that keeps an alpha channel in the palette
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    return image.quantize(colors, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+
+
+def encode_image(image: Image.Image, profile_name: str) -> bytes:
+    profile = get_profile(profile_name)
+    if "colors" in profile:
+        image = quantize(image, profile["colors"])
+    params = dict(profile["params"])
+    if profile["format"] == "PNG" and PNG_TEXT_KEYS & image.info.keys():
+        pnginfo = PngInfo()
+        for key in PNG_TEXT_KEYS & image.info.keys():
+            pnginfo.add_text(key, image.info[key])
+        params["pnginfo"] = pnginfo
+    buffered = io.BytesIO()
+    image.save(buffered, format=profile["format"], **params)
+    return buffered.getvalue()
+
+
+def fit_pixel_budget(image: Image.Image, max_pixels: int) -> Image.Image:
+    # Call before load(): a JPEG is decoded straight at the mildest 1/2, 1/4 or 1/8 scale that fits
+    # the budget, so the full-size image is never in memory. Anything still over budget is resampled
+    width, height = image.size
+    if width * height <= max_pixels:
+        return image
+
+    reduction = 1
+    while reduction < 8 and width * height > max_pixels * reduction * reduction:
+        reduction *= 2
+    image.draft(None, (math.ceil(width / reduction), math.ceil(height / reduction)))
+
+    if image.size[0] * image.size[1] <= max_pixels:
+        return image
+    scale = math.sqrt(max_pixels / (width * height))
+    target = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return image.resize(target, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+
+def _save_upload(image: Image.Image, upload_format: str, quality: int) -> bytes:
+    buffered = io.BytesIO()
+    if upload_format == "PNG":
+        image.save(buffered, format="PNG", compress_level=1)
+    else:
+        image.save(buffered, format=upload_format, quality=quality)
+    return buffered.getvalue()
+
+
+def strip_jpeg_metadata(image_bytes: bytes) -> bytes:
+    # Drops APP1 (EXIF/XMP) and COM segments; the entropy-coded pixels are copied untouched
+    output = bytearray(image_bytes[:2])
+    position = 2
+    while position + 4 <= len(image_bytes) and image_bytes[position] == 0xFF:
+        marker = image_bytes[position + 1]
+        if marker == 0xDA:
+            break
+        length = int.from_bytes(image_bytes[position + 2:position + 4], "big")
+        if marker not in (0xE1, 0xFE):
+            output += image_bytes[position:position + 2 + length]
+        position += 2 + length
+    output += image_bytes[position:]
+    return bytes(output)
+
+
+def _can_pass_through(image: Image.Image, image_bytes: bytes, upload_format: str) -> bool:
+    width, height = image.size
+    return (
+        upload_format == "JPEG"
+        and image.format == "JPEG"
+        and image.mode in ("RGB", "L")
+        and image.getexif().get(0x0112, 1) == 1
+        and width * height <= settings.openrouter_upload_max_pixels
+        and len(image_bytes) <= settings.openrouter_upload_max_bytes
+    )
+
+
+def encode_upload(image_bytes: bytes) -> tuple[bytes, str]:
+    upload_format = settings.openrouter_upload_format.upper()
+    if upload_format not in UPLOAD_FORMATS:
+        logger.warning(f"Unknown upload format {upload_format!r}, using JPEG")
+        upload_format = "JPEG"
+
+    image = Image.open(io.BytesIO(image_bytes))
+    if _can_pass_through(image, image_bytes, upload_format):
+        # Re-encoding an already compressed JPEG within budget only makes it bigger
+        data = strip_jpeg_metadata(image_bytes)
+        logger.info(
+            f"Upload passed through: {len(image_bytes) / 1024:.1f} KB -> {len(data) / 1024:.1f} KB "
+            f"JPEG {image.size[0]}x{image.size[1]} (metadata stripped, not re-encoded)"
+        )
+        return data, UPLOAD_FORMATS[upload_format]
+
+    image = fit_pixel_budget(image, settings.openrouter_upload_max_pixels)
+    # Orientation is applied to the pixels; the EXIF block itself is not written back
+    image = ImageOps.exif_transpose(image).convert("RGB")
+
+    quality = settings.openrouter_upload_quality
+    data = _save_upload(image, upload_format, quality)
+    while len(data) > settings.openrouter_upload_max_bytes:
+        if upload_format != "PNG" and quality > UPLOAD_MIN_QUALITY:
+            quality = max(UPLOAD_MIN_QUALITY, quality - 10)
+        else:
+            width, height = image.size
+            if min(width, height) <= 64:
+                break
+            image = image.resize((int(width * 0.75), int(height * 0.75)), Image.Resampling.LANCZOS)
+        data = _save_upload(image, upload_format, quality)
+
+    logger.info(
+        f"Upload encoded: {len(image_bytes) / 1024:.1f} KB -> {len(data) / 1024:.1f} KB "
+        f"{upload_format} {image.size[0]}x{image.size[1]} q={quality}"
+    )
+    return data, UPLOAD_FORMATS[upload_format]
+
+
+def report_encoder_profiles(image: Image.Image, profiles=None) -> list[dict]:
+    results = []
+    baseline = len(encode_image(image, DEFAULT_PROFILE))
+    for name in profiles or ENCODER_PROFILES:
+        started = time.perf_counter()
+        data = encode_image(image, name)
+        results.append({
+            "profile": name,
+            "bytes": len(data),
+            "seconds": time.perf_counter() - started,
+            "saving": 1 - len(data) / baseline,
+        })
+    return results
+
+
+def main(paths: list[str]):
+    from services.image_service import ImageService
+
+    for path in paths:
+        with open(path, "rb") as f:
+            image = ImageService._decode_rgba(f.read())
+
+        for variant, rendered in ImageService.render_variant_images(image).items():
+            print(f"{path} [{variant}] {rendered.size[0]}x{rendered.size[1]}")
+            for row in report_encoder_profiles(rendered):
+                print(
+                    f"  {row['profile']:<22} {row['bytes'] / 1024:>10.1f} KB {row['seconds'] * 1000:>9.1f} ms "
+                    f"{row['saving'] * 100:>6.1f}% vs {DEFAULT_PROFILE}"
+                )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or [settings.test_transparent_image_path])
@@ -0,0 +1,122 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from multiprocessing import shared_memory
+from typing import Optional, Union
+from config import settings
+from utils.logger import logger
+
+_executor: Optional[Executor] = None
+_executor_mode: Optional[str] = None
+
+
+class SharedImageBuffer:
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+
+
+ImageHandle = Union[bytes, SharedImageBuffer]
+
+
+def _resolve_mode() -> str:
+    mode = settings.image_executor_mode.lower()
+    if mode == "process" and multiprocessing.current_process().daemon:
+        # Celery prefork children are daemonic and are not allowed to have children of their own
+        logger.warning("Image executor: daemon process, falling back to thread mode")
+        return "thread"
+    if mode not in ("process", "thread", "inline"):
+        logger.warning(f"Image executor: unknown mode {mode!r}, using inline")
+        return "inline"
+    return mode
+
+
+def get_image_executor() -> Optional[Executor]:
+    global _executor, _executor_mode
+
+    if _executor_mode is None:
+        _executor_mode = _resolve_mode()
+        workers = settings.image_executor_workers or os.cpu_count() or 1
+
+        if _executor_mode == "process":
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        elif _executor_mode == "thread":
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image")
+
+        logger.info(f"Image executor: mode={_executor_mode}, workers={workers}")
+
+    return _executor
+
+
+def shutdown_image_executor():
+    global _executor, _executor_mode
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+    _executor_mode = None
+
+
+# Buffers shared for the lifetime of a request, keyed by id(); the bytes object is kept to check identity
+_shared: dict[int, tuple[bytes, SharedImageBuffer]] = {}
+
+
+@contextmanager
+def share_image_bytes(image_bytes: bytes):
+    # Copies the bytes into shared memory once; jobs given the same bytes object inside the block reuse it
+    get_image_executor()
+    entry = _shared.get(id(image_bytes))
+    if entry is not None and entry[0] is image_bytes:
+        yield entry[1]
+        return
+    if _executor_mode != "process" or len(image_bytes) < settings.image_shm_threshold_bytes:
+        yield image_bytes
+        return
+
+    shm = shared_memory.SharedMemory(create=True, size=len(image_bytes))
+    handle = SharedImageBuffer(shm.name, len(image_bytes))
+    _shared[id(image_bytes)] = (image_bytes, handle)
+    try:
+        shm.buf[:len(image_bytes)] = image_bytes
+        yield handle
+    finally:
+        del _shared[id(image_bytes)]
+        shm.close()
+        shm.unlink()
+
+
+def _read_handle(handle: ImageHandle) -> bytes:
+    if not isinstance(handle, SharedImageBuffer):
+        return handle
+
+    shm = shared_memory.SharedMemory(name=handle.name)
+    try:
+        return bytes(shm.buf[:handle.size])
+    finally:
+        shm.close()
+
+
+def _run_job(func, args: tuple):
+    return func(*(_read_handle(arg) for arg in args))
+
+
+async def run_image_job(func, *args):
+    executor = get_image_executor()
+    if executor is None:
+        return _run_job(func, args)
+
+    if _executor_mode != "process":
+        return await asyncio.get_running_loop().run_in_executor(executor, _run_job, func, args)
+
+    # Every large bytes argument crosses the process boundary through shared memory, not pickling
+    with ExitStack() as stack:
+        handles = tuple(
+            stack.enter_context(share_image_bytes(arg)) if isinstance(arg, bytes) else arg
+            for arg in args
+        )
+        return await asyncio.get_running_loop().run_in_executor(executor, _run_job, func, handles)
@@ -1,9 +1,24 @@
-import requests
 import io
-import base64
-from PIL import Image, ImageDraw, ImageFont
+import time
+from PIL import Image
 from config import settings
 from utils.logger import logger
+from utils import metrics
+from services.watermark import apply_watermark
+from services.image_encoding import encode_image
+from services.matting import (
+    AUTOCROP_KEY, apply_mask, aspect_matches, autocrop, composite_onto_original, decode_original, extract_alpha,
+    refine_mask, repair_cutout, uncrop_mask
+)
+from services.result_cache import ResultCache, make_cache_key
+from services.single_flight import SingleFlight
+from services.circuit_breaker import CircuitOpenError, call_with_breaker
+from services.removal_backends import OpenRouterBackend, RemovalBackend, TestImageBackend, get_backend
+from services.backend_router import get_router
+
+PREVIEW_VARIANTS = ('transparent_watermarked', 'bw_watermarked')
+
+_removals = SingleFlight("remove_background.single_flight")
 
 
 class ImageService:
@@ -16,90 +31,121 @@ class ImageService:
         else:
             raise TypeError(f"Expected bytes, got {type(image_data)}")
 
+    @staticmethod
+    def removals_in_flight() -> int:
+        return _removals.in_flight()
+
     @staticmethod
     def remove_background(image_bytes: bytes, improved: bool = False) -> bytes:
         if settings.test_mode:
-            logger.info("TEST MODE: Using test transparent image")
-            try:
-                path = settings.test_transparent_image_path_improved if improved else settings.test_transparent_image_path
-                with open(path, "rb") as f:
-                    return f.read()
-            except FileNotFoundError:
-                logger.error(f"Test image not found")
-                return image_bytes
+            return TestImageBackend.load(image_bytes, improved)
         
         image_bytes = ImageService._ensure_bytes(image_bytes)
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {settings.openrouter_token}",
-            "Content-Type": "application/json"
-        }
 
         try:
-            logger.info("Removing background")
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            buffered = io.BytesIO()
-            image.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
-
-            prompt_text = (
-                "Remove background with high precision. Pay special attention to hair details, "
-                "edges, and fine details. Make the cutout as clean and professional as possible."
-            ) if improved else "Delete background"
-
-            payload = {
-                "model": "google/gemini-2.5-flash-preview-image",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt_text},
-                            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_str}"}}
-                        ]
-                    }
-                ],
-                "max_tokens": 0,
-                "modalities": ["image", "text"]
-            }
+            return get_backend(OpenRouterBackend.kind).remove_background_sync(image_bytes, improved)
+        except Exception as e:
+            raise Exception(f"Failed to remove background: {e}")
+
+    @staticmethod
+    async def remove_background_async(image_bytes: bytes, improved: bool = False) -> bytes:
+        if settings.test_mode:
+            return TestImageBackend.load(image_bytes, improved)
+
+        image_bytes = ImageService._ensure_bytes(image_bytes)
+        router = get_router()
+        backend = router.choose(improved)
+        if backend is None:
+            backend = router.choose(improved, use_fallback=True)
+        if backend is None:
+            raise Exception("Failed to remove background: no backend available")
+
+        tried = {backend.name}
+        while True:
+            try:
+                return await ImageService._remove_background_coalesced(backend, image_bytes, improved)
+            except Exception as e:
+                alternative = router.choose(improved, exclude=tried, use_fallback=True)
+                if alternative is None:
+                    raise
+                logger.warning(f"Backend {backend.name} failed ({e}), using {alternative.name}")
+                metrics.incr("remove_background.fallback.errors")
+                backend = alternative
+                tried.add(backend.name)
 
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
-            response.raise_for_status()
-            data = response.json()
-            message = data.get("choices", [{}])[0].get("message", {})
-            
-            if message.get("images"):
-                image_obj = message["images"][0]
-                if image_obj.get("type") == "image_url":
-                    image_url = image_obj["image_url"]["url"]
-                    if image_url.startswith("data:image/png;base64,"):
-                        base64_data = image_url.split(",")[1]
-                        return base64.b64decode(base64_data)
-            
-            raise ValueError("No image found in response")
+    @staticmethod
+    async def _remove_background_coalesced(backend: RemovalBackend, image_bytes: bytes, improved: bool) -> bytes:
+        model, prompt_text = backend.cache_params(improved)
+        cache_key = make_cache_key(image_bytes, improved, model, prompt_text)
+
+        return await _removals.do(
+            cache_key, lambda: ImageService._remove_background_cached(backend, image_bytes, improved, cache_key)
+        )
+
+    @staticmethod
+    async def _remove_background_cached(
+        backend: RemovalBackend, image_bytes: bytes, improved: bool, cache_key: str
+    ) -> bytes:
+        cached = await ResultCache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Background removal served from cache ({cache_key[:12]})")
+            return cached
+
+        router = get_router()
+        started = time.perf_counter()
+        try:
+            async with router.slot(backend):
+                result = await call_with_breaker(
+                    backend.name,
+                    lambda: backend.remove_background(image_bytes, improved),
+                    hedge=settings.hedge_enabled and backend.name in settings.hedge_backends
+                )
+            elapsed = time.perf_counter() - started
+            router.record(backend, elapsed, True)
+            metrics.incr("remove_background.calls")
+            metrics.incr("remove_background.seconds", elapsed)
+            metrics.incr(f"remove_background.{backend.name}.calls")
+            metrics.incr(f"remove_background.{backend.name}.seconds", elapsed)
 
         except Exception as e:
+            # A breaker rejection never reached the backend, so it says nothing about its health
+            if not isinstance(e, CircuitOpenError):
+                router.record(backend, time.perf_counter() - started, False)
+            metrics.incr(f"remove_background.{backend.name}.errors")
             raise Exception(f"Failed to remove background: {e}")
 
+        await ResultCache.put(cache_key, result)
+        return result
+
+    @staticmethod
+    def _decode_rgba(image_bytes: bytes) -> Image.Image:
+        return Image.open(io.BytesIO(image_bytes)).convert("RGBA")
+
+    @staticmethod
+    def _to_black_and_white(image: Image.Image) -> Image.Image:
+        # Luminance + alpha: keeps the cutout's transparency at half the channels of RGBA
+        return image.convert("LA")
+
+    @staticmethod
+    def _load_test_bw(image_bytes: bytes) -> bytes:
+        logger.info("TEST MODE: Using test BW image")
+        try:
+            with open(settings.test_bw_image_path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            logger.error(f"Test BW image not found")
+            return image_bytes
+
     @staticmethod
     def convert_to_black_and_white(image_bytes: bytes) -> bytes:
         if settings.test_mode:
-            logger.info("TEST MODE: Using test BW image")
-            try:
-                with open(settings.test_bw_image_path, "rb") as f:
-                    return f.read()
-            except FileNotFoundError:
-                logger.error(f"Test BW image not found")
-                return image_bytes
+            return ImageService._load_test_bw(image_bytes)
         
         image_bytes = ImageService._ensure_bytes(image_bytes)
         
         try:
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGBA")
-            bw_image = image.convert("L").convert("RGBA")
-            
-            buffered = io.BytesIO()
-            bw_image.save(buffered, format="PNG")
-            return buffered.getvalue()
+            image = ImageService._decode_rgba(image_bytes)
+            return encode_image(ImageService._to_black_and_white(image), settings.clean_encoder_profile)
         except Exception as e:
             logger.error(f"Error converting to B&W: {e}")
             raise Exception(f"Failed to convert to black and white: {e}")
@@ -111,58 +157,113 @@ class ImageService:
             return image_bytes
         
         image_bytes = ImageService._ensure_bytes(image_bytes)
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGBA")
+        image = ImageService._decode_rgba(image_bytes)
+        return encode_image(apply_watermark(image), settings.preview_encoder_profile)
+
+    @staticmethod
+    def _preview_base(image: Image.Image) -> Image.Image:
+        limit = settings.preview_max_dimension
         width, height = image.size
+        if limit <= 0 or max(width, height) <= limit:
+            return image
+        scale = limit / max(width, height)
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        # reducing_gap takes an integer box reduce() first, so only the last step is a full Lanczos pass
+        return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
 
-        overlay = Image.new('RGBA', image.size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(overlay)
-
-        font_size = max(13, min(29, min(width, height) // 45))
-        font = None
-        font_paths = [
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-            "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
-            "/System/Library/Fonts/Helvetica.ttc",
-            "C:\\Windows\\Fonts\\arial.ttf",
-        ]
-        
-        for font_path in font_paths:
-            try:
-                font = ImageFont.truetype(font_path, font_size)
-                break
-            except (OSError, IOError):
-                continue
-        
-        if font is None:
-            try:
-                font = ImageFont.load_default(size=font_size)
-            except:
-                font = ImageFont.load_default()
-
-        text = "Обработка фото"
-        bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
-        
-        horizontal_spacing = text_width * 1.2
-        vertical_spacing = text_height * 1.5
-        
-        num_cols = int(width / horizontal_spacing) + 2
-        num_rows = int(height / vertical_spacing) + 2
-        
-        total_grid_width = (num_cols - 1) * horizontal_spacing
-        total_grid_height = (num_rows - 1) * vertical_spacing
-        start_x = (width - total_grid_width) / 2
-        start_y = (height - total_grid_height) / 2
-        
-        for row in range(num_rows):
-            for col in range(num_cols):
-                x = int(start_x + col * horizontal_spacing)
-                y = int(start_y + row * vertical_spacing)
-                draw.text((x, y), text, font=font, fill=(0, 0, 0, 200), stroke_width=0)
-
-        watermarked = Image.alpha_composite(image, overlay)
-        buffered = io.BytesIO()
-        watermarked.save(buffered, format="PNG")
-        
-        return buffered.getvalue()
\ No newline at end of file
+    @staticmethod
+    def render_variant_images(image: Image.Image) -> dict[str, Image.Image]:
+        transparent = image if image.mode == "RGBA" else image.convert("RGBA")
+        if settings.autocrop_enabled:
+            transparent = autocrop(transparent)
+        bw = ImageService._to_black_and_white(transparent)
+        preview = ImageService._preview_base(transparent)
+        preview_bw = bw if preview is transparent else ImageService._to_black_and_white(preview)
+        return {
+            'transparent_bytes': transparent,
+            'bw_bytes': bw,
+            'transparent_watermarked': apply_watermark(preview),
+            'bw_watermarked': apply_watermark(preview_bw).convert("LA")
+        }
+
+    @staticmethod
+    def render_variants(transparent_bytes: bytes, original_bytes: bytes = None) -> dict[str, bytes]:
+        transparent_bytes = ImageService._ensure_bytes(transparent_bytes)
+
+        if settings.test_mode:
+            bw_bytes = ImageService._load_test_bw(transparent_bytes)
+            logger.info("TEST MODE: Skipping watermark")
+            return {
+                'transparent_bytes': transparent_bytes,
+                'bw_bytes': bw_bytes,
+                'transparent_watermarked': transparent_bytes,
+                'bw_watermarked': bw_bytes
+            }
+
+        try:
+            cutout = Image.open(io.BytesIO(transparent_bytes))
+            repaired = None
+            if settings.alpha_repair_enabled:
+                repaired = repair_cutout(cutout)
+                if repaired is not None:
+                    cutout = repaired
+            transparent = None
+            if original_bytes is not None and settings.full_resolution_output:
+                original = decode_original(ImageService._ensure_bytes(original_bytes))
+                transparent = composite_onto_original(original, cutout)
+            passthrough = transparent is None and repaired is None
+            if transparent is None:
+                transparent = cutout.convert("RGBA")
+            images = ImageService.render_variant_images(transparent)
+            passthrough = passthrough and images['transparent_bytes'] is transparent
+        except Exception as e:
+            logger.error(f"Error rendering variants: {e}")
+            raise Exception(f"Failed to render variants: {e}")
+
+        # The model already returned a PNG for the clean cutout; only re-encode it for a different profile
+        if passthrough and settings.clean_encoder_profile == "png":
+            return ImageService._encode_variants(images, {'transparent_bytes': transparent_bytes})
+        return ImageService._encode_variants(images)
+
+    @staticmethod
+    def _encode_variants(images: dict[str, Image.Image], encoded: dict[str, bytes] = None) -> dict[str, bytes]:
+        variants = dict(encoded or {})
+        for name, image in images.items():
+            if name not in variants:
+                profile = settings.preview_encoder_profile if name in PREVIEW_VARIANTS else settings.clean_encoder_profile
+                variants[name] = encode_image(image, profile)
+        pixels = sum(image.size[0] * image.size[1] for image in images.values())
+        logger.info(
+            f"Variants rendered: {pixels / 1e6:.2f} MP, {sum(len(data) for data in variants.values()) / 1024:.1f} KB to upload"
+        )
+        return variants
+
+    @staticmethod
+    def render_improved_variants(standard_bytes: bytes, original_bytes: bytes) -> dict[str, bytes]:
+        if settings.test_mode:
+            return ImageService.render_variants(TestImageBackend.load(standard_bytes, improved=True))
+
+        try:
+            original = decode_original(ImageService._ensure_bytes(original_bytes))
+            standard = Image.open(io.BytesIO(ImageService._ensure_bytes(standard_bytes)))
+            # autocrop() only stamps a box when it trimmed something; without one the mask covers the
+            # whole original, which the aspect check below confirms
+            autocrop_info = standard.info.get(AUTOCROP_KEY)
+            if settings.alpha_repair_enabled:
+                repaired = repair_cutout(standard)
+                if repaired is not None:
+                    standard = repaired
+            mask = extract_alpha(standard)
+            if mask is None:
+                raise ValueError("standard result has no alpha channel")
+            if autocrop_info is not None:
+                mask = uncrop_mask(mask, autocrop_info)
+            if not aspect_matches(original.size, mask.size):
+                raise ValueError(f"standard result {mask.size} does not line up with original {original.size}")
+            improved = apply_mask(original, refine_mask(original, mask))
+            images = ImageService.render_variant_images(improved)
+        except Exception as e:
+            logger.error(f"Error rendering improved variants: {e}")
+            raise Exception(f"Failed to render improved variants: {e}")
+
+        return ImageService._encode_variants(images)
@@ -0,0 +1,243 @@
+import io
+from typing import Optional
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageMath, ImageOps, ImageStat
+from config import settings
+from utils.logger import logger
+
+AUTOCROP_KEY = "autocrop"
+
+
+def decode_original(original_bytes: bytes) -> Image.Image:
+    # The upload sent to the model had its EXIF orientation applied, so the original must match
+    image = Image.open(io.BytesIO(original_bytes))
+    return ImageOps.exif_transpose(image).convert("RGB")
+
+
+def extract_alpha(cutout: Image.Image) -> Optional[Image.Image]:
+    if cutout.mode in ("RGBA", "LA") or (cutout.mode == "P" and "transparency" in cutout.info):
+        return cutout.convert("RGBA").getchannel("A")
+    return None
+
+
+def aspect_matches(size_a: tuple[int, int], size_b: tuple[int, int]) -> bool:
+    ratio_a = size_a[0] / size_a[1]
+    ratio_b = size_b[0] / size_b[1]
+    return abs(ratio_a - ratio_b) / ratio_b <= settings.mask_aspect_tolerance
+
+
+def upsample_mask(mask: Image.Image, size: tuple[int, int]) -> Image.Image:
+    if mask.size == size:
+        return mask
+    return mask.resize(size, Image.Resampling.BICUBIC)
+
+
+def feather_mask(mask: Image.Image, radius: float) -> Image.Image:
+    if radius <= 0:
+        return mask
+    return mask.filter(ImageFilter.GaussianBlur(radius))
+
+
+def apply_mask(original: Image.Image, mask: Image.Image) -> Image.Image:
+    result = original.convert("RGB")
+    result.putalpha(mask)
+    return result
+
+
+def composite_onto_original(original: Image.Image, cutout: Image.Image) -> Optional[Image.Image]:
+    mask = extract_alpha(cutout)
+    if mask is None:
+        logger.warning("Mask compositing skipped: model output has no alpha channel")
+        return None
+
+    if not aspect_matches(original.size, cutout.size):
+        logger.warning(
+            f"Mask compositing skipped: aspect mismatch {cutout.size} vs original {original.size}"
+        )
+        return None
+
+    mask = upsample_mask(mask, original.size)
+    # Blur scales with the upsampling factor so stair-stepped edges from a small mask are hidden
+    scale = original.size[0] / cutout.size[0]
+    mask = feather_mask(mask, settings.mask_feather_radius * max(1.0, scale))
+    return apply_mask(original, mask)
+
+
+def alpha_bbox(image: Image.Image, padding: int = 0) -> Optional[tuple[int, int, int, int]]:
+    # Faint feathering noise below the threshold does not count as content
+    level = settings.autocrop_alpha_threshold
+    bbox = image.getchannel("A").point([255 if v >= level else 0 for v in range(256)]).getbbox()
+    if bbox is None:
+        return None
+    width, height = image.size
+    left, top, right, bottom = bbox
+    return max(0, left - padding), max(0, top - padding), min(width, right + padding), min(height, bottom + padding)
+
+
+def uncrop_mask(mask: Image.Image, autocrop_info: str) -> Image.Image:
+    left, top, right, bottom, width, height = (int(v) for v in autocrop_info.split(","))
+    canvas = Image.new("L", (width, height), 0)
+    canvas.paste(upsample_mask(mask, (right - left, bottom - top)), (left, top))
+    return canvas
+
+
+def autocrop(image: Image.Image) -> Image.Image:
+    bbox = alpha_bbox(image, settings.autocrop_padding)
+    if bbox is None or bbox == (0, 0, *image.size):
+        return image
+
+    cropped = image.crop(bbox)
+    # Written into the PNG so the improved render can put the mask back where it was on the original
+    cropped.info[AUTOCROP_KEY] = ",".join(str(v) for v in (*bbox, *image.size))
+    before = image.size[0] * image.size[1]
+    after = cropped.size[0] * cropped.size[1]
+    logger.info(
+        f"Autocrop {image.size[0]}x{image.size[1]} -> {cropped.size[0]}x{cropped.size[1]} "
+        f"({(1 - after / before) * 100:.1f}% fewer pixels)"
+    )
+    return cropped
+
+
+def _border_pixels(image: Image.Image, thickness: int) -> Image.Image:
+    width, height = image.size
+    strips = [
+        image.crop((0, 0, width, thickness)),
+        image.crop((0, height - thickness, width, height)),
+        image.crop((0, 0, thickness, height)).rotate(90, expand=True),
+        image.crop((width - thickness, 0, width, height)).rotate(90, expand=True),
+    ]
+    border = Image.new(image.mode, (sum(s.size[0] for s in strips), thickness))
+    x = 0
+    for strip in strips:
+        border.paste(strip, (x, 0))
+        x += strip.size[0]
+    return border
+
+
+def estimate_background_color(image: Image.Image) -> tuple[int, int, int]:
+    thickness = max(1, min(image.size) // 50)
+    return tuple(int(v) for v in ImageStat.Stat(_border_pixels(image, thickness)).median[:3])
+
+
+def color_distance_image(image: Image.Image, reference: Image.Image) -> Image.Image:
+    red, green, blue = ImageChops.difference(image, reference).split()
+    return ImageChops.lighter(ImageChops.lighter(red, green), blue)
+
+
+def color_distance(image: Image.Image, color: tuple[int, int, int]) -> Image.Image:
+    return color_distance_image(image, Image.new("RGB", image.size, color))
+
+
+def alpha_is_degenerate(alpha: Image.Image) -> bool:
+    histogram = alpha.histogram()
+    transparent = sum(histogram[:128]) / (alpha.size[0] * alpha.size[1])
+    limit = settings.alpha_min_transparent_ratio
+    return transparent < limit or transparent > 1 - limit
+
+
+def has_flat_border(image: Image.Image, background_color: tuple[int, int, int]) -> bool:
+    # A logo or the subject touching the edge is fine as long as most of the border is one colour
+    thickness = max(1, min(image.size) // 50)
+    border = _border_pixels(image.convert("RGB"), thickness)
+    histogram = color_distance(border, background_color).histogram()
+    close = sum(histogram[:settings.local_segmentation_threshold]) / (border.size[0] * border.size[1])
+    return close >= settings.alpha_flat_border_min_ratio
+
+
+def _soft_ramp(low: int, high: int):
+    span = max(1, high - low)
+    return [0 if v <= low else 255 if v >= high else (v - low) * 255 // span for v in range(256)]
+
+
+def _border_connected(background: Image.Image) -> Image.Image:
+    # floodfill is pure Python, so connectivity is resolved on a small copy of the mask
+    width, height = background.size
+    seeds = [(x, y) for x in range(width) for y in (0, height - 1)]
+    seeds += [(x, y) for y in range(height) for x in (0, width - 1)]
+    for seed in seeds:
+        if background.getpixel(seed) == 255:
+            ImageDraw.floodfill(background, seed, 128)
+    return background.point([255 if v == 128 else 0 for v in range(256)])
+
+
+def segment_background(image: Image.Image, background_color: tuple[int, int, int] = None) -> Image.Image:
+    image = image.convert("RGB")
+    work = image.copy()
+    work.thumbnail((settings.local_segmentation_size,) * 2, Image.Resampling.BILINEAR)
+
+    if background_color is None:
+        background_color = estimate_background_color(work)
+    distance = color_distance(work, background_color).filter(ImageFilter.MedianFilter(3))
+
+    low = settings.local_segmentation_threshold
+    high = low + settings.local_segmentation_softness
+    soft_alpha = distance.point(_soft_ramp(low, high))
+
+    small = distance.copy()
+    small.thumbnail((settings.local_connectivity_size,) * 2, Image.Resampling.BILINEAR)
+    candidates = small.point([255 if v < high else 0 for v in range(256)])
+    connected = _border_connected(candidates).resize(work.size, Image.Resampling.BILINEAR)
+
+    # Background-coloured areas that are enclosed by the subject stay opaque
+    alpha = ImageChops.lighter(soft_alpha, ImageChops.invert(connected))
+    alpha = alpha.filter(ImageFilter.MedianFilter(3)).filter(ImageFilter.GaussianBlur(1))
+    return upsample_mask(alpha, image.size)
+
+
+def repair_cutout(cutout: Image.Image) -> Optional[Image.Image]:
+    # Returns None when the model output is usable as is. Geometry is never changed here: a cutout whose
+    # aspect differs from the input was padded or cropped by the model and cannot be mapped back by resizing
+    alpha = extract_alpha(cutout)
+    if alpha is not None and not alpha_is_degenerate(alpha):
+        return None
+
+    image = cutout.convert("RGB")
+    background_color = estimate_background_color(image)
+    if not has_flat_border(image, background_color):
+        logger.warning("Cutout has no usable alpha and no flat background to rebuild it from")
+        return None
+
+    logger.warning(f"Cutout alpha {'missing' if alpha is None else 'degenerate'}, rebuilding from flat background")
+    return apply_mask(image, segment_background(image, background_color))
+
+
+def _threshold(image: Image.Image, level: int) -> Image.Image:
+    return image.point([255 if v >= level else 0 for v in range(256)])
+
+
+def _local_mean(image: Image.Image, weight: Image.Image, radius: float) -> Image.Image:
+    # Normalized convolution: blur(I * w) / blur(w) gives the mean colour of the weighted region only
+    weighted = ImageChops.multiply(image, Image.merge("RGB", (weight,) * 3)).filter(ImageFilter.BoxBlur(radius))
+    norm = weight.filter(ImageFilter.BoxBlur(radius))
+    channels = [
+        ImageMath.lambda_eval(
+            lambda args: args["convert"](args["float"](args["c"]) * 255 / (args["w"] + 1), "L"),
+            c=channel, w=norm,
+        )
+        for channel in weighted.split()
+    ]
+    return Image.merge("RGB", channels)
+
+
+def refine_mask(original: Image.Image, mask: Image.Image, band_radius: int = None) -> Image.Image:
+    original = original.convert("RGB")
+    mask = upsample_mask(mask, original.size)
+    if band_radius is None:
+        band_radius = max(2, min(original.size) // settings.improved_band_divisor)
+
+    solid = _threshold(mask, 128)
+    spread = solid.filter(ImageFilter.BoxBlur(band_radius))
+    foreground = _threshold(spread, 255)
+    background = ImageChops.invert(_threshold(spread, 1))
+    band = ImageChops.invert(ImageChops.lighter(foreground, background))
+
+    colour_radius = band_radius * 3
+    distance_fg = color_distance_image(original, _local_mean(original, foreground, colour_radius))
+    distance_bg = color_distance_image(original, _local_mean(original, background, colour_radius))
+
+    estimate = ImageMath.lambda_eval(
+        lambda args: args["convert"](args["float"](args["bg"]) * 255 / (args["bg"] + args["fg"] + 1), "L"),
+        bg=distance_bg, fg=distance_fg,
+    ).filter(ImageFilter.MedianFilter(3))
+
+    refined = Image.composite(estimate, mask, band)
+    return feather_mask(refined, settings.mask_feather_radius)
@@ -0,0 +1,107 @@
+import io
+import threading
+import time
+from collections import deque
+from typing import Optional
+from PIL import Image, ImageOps
+from config import settings
+from utils import metrics
+
+HASH_SIZE = 8
+COLOR_SIZE = 8
+
+
+def _thumbnail_source(image_bytes: bytes) -> Image.Image:
+    image = Image.open(io.BytesIO(image_bytes))
+    # Only tiny thumbnails are needed, so let the JPEG decoder skip most of the work
+    image.draft("RGB", (HASH_SIZE * 8, HASH_SIZE * 8))
+    return ImageOps.exif_transpose(image).convert("RGB")
+
+
+def compute_fingerprint(image_bytes: bytes) -> tuple[int, bytes]:
+    # dHash finds candidates; the colour thumbnail confirms them, since dHash only sees luminance edges
+    image = _thumbnail_source(image_bytes)
+    return _dhash(image), image.resize((COLOR_SIZE, COLOR_SIZE), Image.Resampling.BOX).tobytes()
+
+
+def color_matches(a: bytes, b: bytes) -> bool:
+    if len(a) != len(b):
+        return False
+    mean_delta = sum(abs(x - y) for x, y in zip(a, b)) / len(a)
+    return mean_delta <= settings.perceptual_color_max_delta
+
+
+def _dhash(image: Image.Image) -> int:
+    pixels = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX).tobytes()
+
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class PerceptualIndex:
+    def __init__(self, per_user_size: int, global_size: int):
+        self.per_user_size = per_user_size
+        self._global = deque(maxlen=global_size)
+        self._by_user: dict[int, deque] = {}
+        self._lock = threading.Lock()
+
+    def add(self, perceptual_hash: int, color: bytes, user_id: int, image_key: str):
+        entry = (perceptual_hash, user_id, image_key, time.time(), color)
+        with self._lock:
+            self._global.append(entry)
+            self._by_user.setdefault(user_id, deque(maxlen=self.per_user_size)).append(entry)
+
+    def _closest(self, entries, perceptual_hash: int, color: bytes, max_distance: int) -> Optional[tuple]:
+        best = None
+        for entry in reversed(entries):
+            distance = hamming_distance(entry[0], perceptual_hash)
+            if distance > max_distance or (best is not None and distance >= best[0]):
+                continue
+            if not color_matches(entry[4], color):
+                metrics.incr("perceptual_index.color_rejects")
+                continue
+            best = (distance, entry)
+            if distance == 0:
+                break
+        return best
+
+    def find(self, perceptual_hash: int, color: bytes, user_id: int, max_distance: int) -> Optional[str]:
+        with self._lock:
+            user_entries = list(self._by_user.get(user_id, ()))
+            global_entries = list(self._global) if settings.perceptual_dedup_global else []
+
+        best = self._closest(user_entries, perceptual_hash, color, max_distance)
+        if best is None:
+            best = self._closest(global_entries, perceptual_hash, color, max_distance)
+
+        if best is None:
+            metrics.incr("perceptual_index.misses")
+            return None
+
+        metrics.incr("perceptual_index.hits")
+        return best[1][2]
+
+    def discard(self, image_key: str):
+        with self._lock:
+            self._global = deque((e for e in self._global if e[2] != image_key), maxlen=self._global.maxlen)
+            for user_id, entries in self._by_user.items():
+                self._by_user[user_id] = deque((e for e in entries if e[2] != image_key), maxlen=entries.maxlen)
+
+
+_index: Optional[PerceptualIndex] = None
+
+
+def get_perceptual_index() -> PerceptualIndex:
+    global _index
+
+    if _index is None:
+        _index = PerceptualIndex(settings.perceptual_index_per_user, settings.perceptual_index_global)
+    return _index
@@ -0,0 +1,214 @@
+import asyncio
+from abc import ABC, abstractmethod
+import base64
+import random
+import requests
+from config import settings
+from utils.logger import logger
+from services.http_client import get_http_session, get_in_flight_limiter
+from services.image_executor import run_image_job
+from services.image_encoding import encode_image, encode_upload
+from services.matting import apply_mask, decode_original, segment_background
+from services.response_parser import decode_data_url, find_image_url, read_image_response
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_MODEL = "google/gemini-2.5-flash-preview-image"
+STANDARD_PROMPT = "Delete background"
+IMPROVED_PROMPT = (
+    "Remove background with high precision. Pay special attention to hair details, "
+    "edges, and fine details. Make the cutout as clean and professional as possible."
+)
+LOCAL_MODEL = "local-flat-background-v1"
+
+
+class RemovalBackend(ABC):
+    kind = "base"
+
+    def __init__(self, name: str = None, cost: float = 0.0, max_concurrency: int = 0, **options):
+        self.name = name or self.kind
+        self.cost = cost
+        self.max_concurrency = max_concurrency
+        if options:
+            logger.warning(f"Backend {self.name}: ignoring unknown options {sorted(options)}")
+
+    @abstractmethod
+    def cache_params(self, improved: bool) -> tuple[str, str]:
+        ...
+
+    def is_saturated(self) -> bool:
+        return False
+
+    @abstractmethod
+    async def remove_background(self, image_bytes: bytes, improved: bool = False) -> bytes:
+        ...
+
+
+class OpenRouterBackend(RemovalBackend):
+    kind = "openrouter"
+
+    def __init__(self, name: str = None, model: str = OPENROUTER_MODEL, url: str = OPENROUTER_URL, **options):
+        # latency/error_rate only describe the local stand-in used when removal_use_stand_ins is on
+        options.pop("latency", None)
+        options.pop("error_rate", None)
+        super().__init__(name, **options)
+        self.model = model
+        self.url = url
+
+    def cache_params(self, improved: bool) -> tuple[str, str]:
+        return self.model, IMPROVED_PROMPT if improved else STANDARD_PROMPT
+
+    def is_saturated(self) -> bool:
+        return get_in_flight_limiter().locked()
+
+    @staticmethod
+    def build_payload(image_bytes: bytes, improved: bool, model: str = OPENROUTER_MODEL) -> dict:
+        upload_bytes, mime_type = encode_upload(image_bytes)
+        img_str = base64.b64encode(upload_bytes).decode()
+        logger.info(f"Request image payload: {len(img_str) / 1024:.1f} KB base64 ({mime_type})")
+
+        prompt_text = IMPROVED_PROMPT if improved else STANDARD_PROMPT
+
+        return {
+            "model": model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt_text},
+                        {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{img_str}"}}
+                    ]
+                }
+            ],
+            "max_tokens": 0,
+            "modalities": ["image", "text"]
+        }
+
+    @staticmethod
+    def extract_image(data: dict) -> bytes:
+        image_url = find_image_url(data)
+        if image_url.startswith("https://"):
+            response = requests.get(image_url, timeout=settings.openrouter_timeout)
+            response.raise_for_status()
+            return response.content
+        return decode_data_url(image_url)
+
+    @staticmethod
+    def headers() -> dict:
+        return {
+            "Authorization": f"Bearer {settings.openrouter_token}",
+            "Content-Type": "application/json"
+        }
+
+    def remove_background_sync(self, image_bytes: bytes, improved: bool = False) -> bytes:
+        logger.info("Removing background")
+        payload = self.build_payload(image_bytes, improved, self.model)
+        response = requests.post(self.url, headers=self.headers(), json=payload, timeout=settings.openrouter_timeout)
+        response.raise_for_status()
+        return self.extract_image(response.json())
+
+    async def remove_background(self, image_bytes: bytes, improved: bool = False) -> bytes:
+        payload = await run_image_job(OpenRouterBackend.build_payload, image_bytes, improved, self.model)
+        session = get_http_session()
+        async with get_in_flight_limiter():
+            logger.info("Removing background")
+            async with session.post(self.url, headers=self.headers(), json=payload) as response:
+                response.raise_for_status()
+                return await read_image_response(response, session)
+
+
+class LocalBackend(RemovalBackend):
+    kind = "local"
+
+    def cache_params(self, improved: bool) -> tuple[str, str]:
+        return LOCAL_MODEL, ""
+
+    @staticmethod
+    def render(image_bytes: bytes, improved: bool = False) -> bytes:
+        original = decode_original(image_bytes)
+        mask = segment_background(original)
+        return encode_image(apply_mask(original, mask), "png_fast")
+
+    async def remove_background(self, image_bytes: bytes, improved: bool = False) -> bytes:
+        logger.info("Removing background locally")
+        return await run_image_job(LocalBackend.render, image_bytes, improved)
+
+
+class TestImageBackend(RemovalBackend):
+    kind = "test"
+
+    def cache_params(self, improved: bool) -> tuple[str, str]:
+        return "test", str(improved)
+
+    @staticmethod
+    def load(image_bytes: bytes, improved: bool = False) -> bytes:
+        logger.info("TEST MODE: Using test transparent image")
+        try:
+            path = settings.test_transparent_image_path_improved if improved else settings.test_transparent_image_path
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            logger.error(f"Test image not found")
+            return image_bytes
+
+    async def remove_background(self, image_bytes: bytes, improved: bool = False) -> bytes:
+        return self.load(image_bytes, improved)
+
+
+class StandInBackend(LocalBackend):
+    kind = "stand_in"
+
+    def __init__(self, name: str = None, model: str = None, latency: float = 0.0,
+                 error_rate: float = 0.0, **options):
+        options.pop("url", None)
+        super().__init__(name, **options)
+        self.model = model or LOCAL_MODEL
+        self.latency = latency
+        self.error_rate = error_rate
+
+    def cache_params(self, improved: bool) -> tuple[str, str]:
+        return f"stand-in:{self.model}", str(improved)
+
+    async def remove_background(self, image_bytes: bytes, improved: bool = False) -> bytes:
+        # Simulates the remote backend's latency and failure profile for routing tests
+        if self.latency:
+            await asyncio.sleep(random.expovariate(1 / self.latency))
+        if random.random() < self.error_rate:
+            raise RuntimeError(f"Stand-in {self.name}: simulated failure")
+        return await super().remove_background(image_bytes, improved)
+
+
+BACKENDS = {
+    OpenRouterBackend.kind: OpenRouterBackend,
+    LocalBackend.kind: LocalBackend,
+    TestImageBackend.kind: TestImageBackend,
+    StandInBackend.kind: StandInBackend,
+}
+
+_instances: dict[str, RemovalBackend] = {}
+
+
+def backend_configs() -> dict[str, dict]:
+    configs = {kind: {"type": kind} for kind in (OpenRouterBackend.kind, LocalBackend.kind, TestImageBackend.kind)}
+    for config in settings.removal_backend_configs:
+        configs[config["name"]] = dict(config)
+    return configs
+
+
+def _create_backend(name: str, config: dict) -> RemovalBackend:
+    options = {key: value for key, value in config.items() if key not in ("name", "type")}
+    kind = config.get("type", name)
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown background removal backend type: {kind}")
+    if settings.removal_use_stand_ins and kind == OpenRouterBackend.kind:
+        kind = StandInBackend.kind
+    return BACKENDS[kind](name=name, **options)
+
+
+def get_backend(name: str) -> RemovalBackend:
+    backend = _instances.get(name)
+    if backend is None:
+        config = backend_configs().get(name)
+        if config is None:
+            raise ValueError(f"Unknown background removal backend: {name}")
+        backend = _instances[name] = _create_backend(name, config)
+    return backend
@@ -0,0 +1,177 @@
+import base64
+import binascii
+import json
+import re
+from typing import Optional
+from utils.logger import logger
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DATA_URL_PATTERN = re.compile(rb'"url"\s*:\s*"data:(image\\?/[\w.+-]+)?[^,"]*,')
+PLACEHOLDER = b"__image__"
+CHUNK_SIZE = 256 * 1024
+
+# JSON escapes that may legitimately appear inside a base64 string: "\/" and wrapped lines
+JSON_ESCAPE_PATTERN = re.compile(rb'\\(?:u([0-9a-fA-F]{4})|(.))', re.S)
+BASE64_ALPHABET = frozenset(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=")
+BASE64_WHITESPACE = frozenset(b"\n\r\t ")
+SHORT_ESCAPES = {b"/": b"/", b"n": b"", b"r": b"", b"t": b""}
+
+
+def loads(document: bytes):
+    if orjson is not None:
+        return orjson.loads(document)
+    return json.loads(document)
+
+
+def _unescape_json(match: re.Match) -> bytes:
+    code, char = match.groups()
+    if char is not None:
+        if char in SHORT_ESCAPES:
+            return SHORT_ESCAPES[char]
+    else:
+        value = int(code, 16)
+        if value in BASE64_ALPHABET:
+            return bytes([value])
+        if value in BASE64_WHITESPACE:
+            return b""
+    raise ValueError(f"Unexpected JSON escape in image data: {match.group(0)!r}")
+
+
+def _unescape_base64(chunk: bytes) -> bytes:
+    chunk = JSON_ESCAPE_PATTERN.sub(_unescape_json, chunk)
+    if b"\\" in chunk:
+        raise ValueError("Unexpected backslash in image data")
+    return chunk
+
+
+class Base64Decoder:
+    def __init__(self, size_hint: int = 0):
+        # Base64 is 4 chars per 3 bytes, so the response size bounds the decoded size
+        self.buffer = bytearray(size_hint * 3 // 4)
+        self.length = 0
+        self._pending = b""
+
+    def feed(self, chunk: bytes):
+        if self._pending:
+            chunk = self._pending + chunk
+        if b"\\" in chunk:
+            # Keep an escape that is split across chunks until the rest of it arrives
+            start = chunk.rfind(b"\\")
+            tail = chunk[start:]
+            keep = len(tail) if len(tail) < 2 or (tail[1:2] == b"u" and len(tail) < 6) else 0
+            self._pending = chunk[len(chunk) - keep:]
+            chunk = _unescape_base64(chunk[:len(chunk) - keep])
+        else:
+            self._pending = b""
+
+        usable = len(chunk) - len(chunk) % 4
+        self._pending = chunk[usable:] + self._pending
+        if usable:
+            self._write(binascii.a2b_base64(chunk[:usable]))
+
+    def _write(self, decoded: bytes):
+        end = self.length + len(decoded)
+        self.buffer[self.length:end] = decoded
+        self.length = end
+
+    def finish(self) -> bytes:
+        if b"\\" in self._pending:
+            raise ValueError("Truncated JSON escape in image data")
+        if self._pending:
+            self._write(binascii.a2b_base64(self._pending))
+            self._pending = b""
+        view = memoryview(self.buffer)[:self.length]
+        try:
+            return bytes(view)
+        finally:
+            view.release()
+
+
+class ImageResponseParser:
+    def __init__(self, size_hint: int = 0):
+        self.size_hint = size_hint
+        self.document = bytearray()
+        self.mime_type: Optional[str] = None
+        self.image: Optional[bytes] = None
+        self._decoder: Optional[Base64Decoder] = None
+        self._scan_from = 0
+
+    def feed(self, chunk: bytes):
+        if self._decoder is not None:
+            end = chunk.find(b'"')
+            if end < 0:
+                self._decoder.feed(chunk)
+                return
+            self._decoder.feed(chunk[:end])
+            self.image = self._decoder.finish()
+            self._decoder = None
+            self.document += PLACEHOLDER
+            chunk = chunk[end:]
+
+        self.document += chunk
+        if self.image is not None:
+            return
+
+        match = DATA_URL_PATTERN.search(self.document, self._scan_from)
+        if match is None:
+            # Keep enough overlap for a marker that is split across chunks
+            self._scan_from = max(0, len(self.document) - 64)
+            return
+
+        self.mime_type = (match.group(1) or b"image/png").replace(b"\\", b"").decode()
+        rest = bytes(self.document[match.end():])
+        del self.document[match.end():]
+        self._decoder = Base64Decoder(self.size_hint)
+        self.feed(rest)
+
+    def finish(self) -> dict:
+        if self._decoder is not None:
+            raise ValueError("Truncated image data in response")
+        return loads(bytes(self.document))
+
+
+def find_image_url(data: dict) -> str:
+    message = data.get("choices", [{}])[0].get("message", {})
+
+    if message.get("images"):
+        image_obj = message["images"][0]
+        if image_obj.get("type") == "image_url":
+            return image_obj["image_url"]["url"]
+
+    raise ValueError("No image found in response")
+
+
+def decode_data_url(url: str) -> bytes:
+    header, _, payload = url.partition(",")
+    if not header.startswith("data:image/") or not header.endswith(";base64"):
+        raise ValueError(f"Unsupported image URL: {header[:40]}")
+    return base64.b64decode(payload)
+
+
+async def download_image(session, url: str) -> bytes:
+    async with session.get(url) as response:
+        response.raise_for_status()
+        buffer = bytearray()
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            buffer += chunk
+    logger.info(f"Downloaded result image: {len(buffer) / 1024:.1f} KB")
+    return bytes(buffer)
+
+
+async def read_image_response(response, session) -> bytes:
+    parser = ImageResponseParser(response.content_length or 0)
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        parser.feed(chunk)
+    data = parser.finish()
+
+    url = find_image_url(data)
+    if parser.image is not None and url.endswith(PLACEHOLDER.decode()):
+        logger.info(f"Decoded {parser.mime_type} result: {len(parser.image) / 1024:.1f} KB")
+        return parser.image
+    if url.startswith("https://"):
+        return await download_image(session, url)
+    return decode_data_url(url)
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+from config import settings
+from utils import metrics
+from utils.logger import logger
+
+_disk_cache = None
+_redis_client = None
+
+
+def make_cache_key(original_bytes: bytes, improved: bool, model: str, prompt: str) -> str:
+    content_hash = hashlib.sha256(original_bytes).hexdigest()
+    params_hash = hashlib.sha256(f"{int(improved)}|{model}|{prompt}".encode()).hexdigest()[:16]
+    return f"{content_hash}-{params_hash}"
+
+
+class DiskResultCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _load_index(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                stat = os.stat(os.path.join(root, name))
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._total += size
+        logger.info(f"Result cache: {len(self._index)} entries, {self._total / 1024 / 1024:.1f} MB on disk")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._index:
+                return None
+            self._index.move_to_end(key)
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            with self._lock:
+                self._total -= self._index.pop(key, 0)
+            return None
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        evicted = []
+        with self._lock:
+            self._total -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._total += len(data)
+            while self._total > self.max_bytes and self._index:
+                old_key, old_size = self._index.popitem(last=False)
+                self._total -= old_size
+                evicted.append(old_key)
+
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except FileNotFoundError:
+                pass
+        if evicted:
+            metrics.incr("result_cache.evictions", len(evicted))
+
+
+def get_disk_cache() -> Optional[DiskResultCache]:
+    global _disk_cache
+
+    if _disk_cache is None and settings.result_cache_max_bytes > 0:
+        _disk_cache = DiskResultCache(settings.result_cache_dir, settings.result_cache_max_bytes)
+    return _disk_cache
+
+
+def get_redis_client():
+    global _redis_client
+
+    if _redis_client is None and settings.result_cache_redis_enabled:
+        import redis.asyncio as aioredis
+
+        _redis_client = aioredis.from_url(settings.redis_url)
+    return _redis_client
+
+
+async def close_result_cache():
+    global _redis_client
+
+    if _redis_client is not None:
+        await _redis_client.aclose()
+        _redis_client = None
+
+
+class ResultCache:
+    @staticmethod
+    async def get(key: str) -> Optional[bytes]:
+        if not settings.result_cache_enabled:
+            return None
+
+        disk = get_disk_cache()
+        if disk is not None:
+            data = await asyncio.to_thread(disk.get, key)
+            if data is not None:
+                metrics.incr("result_cache.hits.disk")
+                return data
+
+        client = get_redis_client()
+        if client is not None:
+            try:
+                data = await client.get(f"{settings.result_cache_redis_prefix}{key}")
+            except Exception as e:
+                logger.warning(f"Result cache: redis get failed: {e}")
+                data = None
+            if data is not None:
+                metrics.incr("result_cache.hits.redis")
+                if disk is not None:
+                    await asyncio.to_thread(disk.put, key, data)
+                return data
+
+        metrics.incr("result_cache.misses")
+        return None
+
+    @staticmethod
+    async def put(key: str, data: bytes):
+        if not settings.result_cache_enabled or not data:
+            return
+
+        disk = get_disk_cache()
+        if disk is not None:
+            try:
+                await asyncio.to_thread(disk.put, key, data)
+            except OSError as e:
+                logger.warning(f"Result cache: disk put failed: {e}")
+
+        client = get_redis_client()
+        if client is not None:
+            try:
+                await client.set(
+                    f"{settings.result_cache_redis_prefix}{key}", data,
+                    ex=settings.result_cache_redis_ttl_seconds
+                )
+            except Exception as e:
+                logger.warning(f"Result cache: redis set failed: {e}")
+
+    @staticmethod
+    def stats() -> dict:
+        hits = metrics.get("result_cache.hits.disk") + metrics.get("result_cache.hits.redis")
+        misses = metrics.get("result_cache.misses")
+        calls = metrics.get("remove_background.calls")
+        avg_seconds = metrics.get("remove_background.seconds") / calls if calls else 0.0
+        return {
+            "hits": int(hits),
+            "misses": int(misses),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "api_calls_saved": int(hits),
+            "seconds_saved": hits * avg_seconds,
+        }
@@ -3,6 +3,7 @@ from aiogram.types import BufferedInputFile
 from utils.logger import logger
 from config import settings
 from typing import Optional, Dict
+from services.image_encoding import clean_extension, preview_extension
 
 class TelegramStorage:
     
@@ -27,6 +28,14 @@ class TelegramStorage:
             logger.error(f"❌ Failed to upload {filename}: {e}")
             return None
     
+    @staticmethod
+    async def upload_original(bot: Bot, original_bytes: bytes, image_key: str) -> Optional[str]:
+        return await TelegramStorage.upload_image(
+            bot, original_bytes,
+            f"original_{image_key}.png",
+            f"🔹 ORIGINAL - {image_key}"
+        )
+    
     @staticmethod
     async def upload_standard_versions(
         bot: Bot,
@@ -37,33 +46,32 @@ class TelegramStorage:
         bw_watermarked: bytes,
         image_key: str
     ) -> Dict[str, str]:
-        original_id = await TelegramStorage.upload_image(
-            bot, original_bytes,
-            f"original_{image_key}.png",
-            f"🔹 ORIGINAL - {image_key}"
-        )
+        clean_ext = clean_extension()
+        preview_ext = preview_extension()
+
+        original_id = await TelegramStorage.upload_original(bot, original_bytes, image_key)
         
         transparent_id = await TelegramStorage.upload_image(
             bot, transparent_bytes,
-            f"std_transparent_{image_key}.png",
+            f"std_transparent_{image_key}.{clean_ext}",
             f"🔹 STANDARD Transparent (Clean) - {image_key}"
         )
         
         bw_id = await TelegramStorage.upload_image(
             bot, bw_bytes,
-            f"std_bw_{image_key}.png",
+            f"std_bw_{image_key}.{clean_ext}",
             f"🔹 STANDARD B&W (Clean) - {image_key}"
         )
         
         watermarked_trans_id = await TelegramStorage.upload_image(
             bot, transparent_watermarked,
-            f"std_transparent_wm_{image_key}.png",
+            f"std_transparent_wm_{image_key}.{preview_ext}",
             f"🔸 STANDARD Transparent (Watermarked) - {image_key}"
         )
         
         watermarked_bw_id = await TelegramStorage.upload_image(
             bot, bw_watermarked,
-            f"std_bw_wm_{image_key}.png",
+            f"std_bw_wm_{image_key}.{preview_ext}",
             f"🔸 STANDARD B&W (Watermarked) - {image_key}"
         )
         
@@ -84,27 +92,30 @@ class TelegramStorage:
         bw_watermarked: bytes,
         image_key: str
     ) -> Dict[str, str]:
+        clean_ext = clean_extension()
+        preview_ext = preview_extension()
+
         transparent_id = await TelegramStorage.upload_image(
             bot, transparent_bytes,
-            f"imp_transparent_{image_key}.png",
+            f"imp_transparent_{image_key}.{clean_ext}",
             f"✨ IMPROVED Transparent (Clean) - {image_key}"
         )
         
         bw_id = await TelegramStorage.upload_image(
             bot, bw_bytes,
-            f"imp_bw_{image_key}.png",
+            f"imp_bw_{image_key}.{clean_ext}",
             f"✨ IMPROVED B&W (Clean) - {image_key}"
         )
         
         watermarked_trans_id = await TelegramStorage.upload_image(
             bot, transparent_watermarked,
-            f"imp_transparent_wm_{image_key}.png",
+            f"imp_transparent_wm_{image_key}.{preview_ext}",
             f"✨ IMPROVED Transparent (Watermarked) - {image_key}"
         )
         
         watermarked_bw_id = await TelegramStorage.upload_image(
             bot, bw_watermarked,
-            f"imp_bw_wm_{image_key}.png",
+            f"imp_bw_wm_{image_key}.{preview_ext}",
             f"✨ IMPROVED B&W (Watermarked) - {image_key}"
         )
         
@@ -115,6 +126,12 @@ class TelegramStorage:
             'watermarked_improved_bw_file_id': watermarked_bw_id
         }
     
+    @staticmethod
+    async def download(bot: Bot, file_id: str) -> bytes:
+        file = await bot.get_file(file_id)
+        downloaded = await bot.download_file(file.file_path)
+        return downloaded.read()
+    
     @staticmethod
     async def send_from_storage(bot: Bot, file_id: str, 
                                chat_id: int, caption: str = None):
@@ -0,0 +1,118 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+from config import settings
+from utils.logger import logger
+
+WATERMARK_TEXT = "Обработка фото"
+WATERMARK_FILL = (0, 0, 0, 200)
+
+FONT_PATHS = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    "/System/Library/Fonts/Helvetica.ttc",
+    "C:\\Windows\\Fonts\\arial.ttf",
+]
+
+_overlay_cache: "OrderedDict[tuple[int, int, int], Image.Image]" = OrderedDict()
+_overlay_lock = threading.Lock()
+
+
+def watermark_font_size(width: int, height: int) -> int:
+    return max(13, min(29, min(width, height) // 45))
+
+
+@lru_cache(maxsize=32)
+def get_font(font_size: int):
+    for font_path in FONT_PATHS:
+        try:
+            return ImageFont.truetype(font_path, font_size)
+        except (OSError, IOError):
+            continue
+
+    try:
+        return ImageFont.load_default(size=font_size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=32)
+def _render_tile(font_size: int) -> tuple[Image.Image, float, float]:
+    font = get_font(font_size)
+    bbox = ImageDraw.Draw(Image.new("RGBA", (1, 1))).textbbox((0, 0), WATERMARK_TEXT, font=font)
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
+
+    horizontal_spacing = text_width * 1.2
+    vertical_spacing = text_height * 1.5
+
+    # Cells must not overlap, otherwise tiling would cut glyphs that reach into the next cell
+    tile_width = max(round(horizontal_spacing), bbox[2])
+    tile_height = max(round(vertical_spacing), bbox[3])
+
+    tile = Image.new("RGBA", (tile_width, tile_height), (0, 0, 0, 0))
+    ImageDraw.Draw(tile).text((0, 0), WATERMARK_TEXT, font=font, fill=WATERMARK_FILL, stroke_width=0)
+    return tile, horizontal_spacing, vertical_spacing
+
+
+def _tile_across(tile: Image.Image, width: int, height: int) -> Image.Image:
+    tile_width, tile_height = tile.size
+    canvas = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    canvas.paste(tile, (0, 0))
+
+    # Double the filled area on each step: O(log n) block copies instead of one draw per cell
+    filled = tile_width
+    while filled < width:
+        canvas.paste(canvas.crop((0, 0, filled, tile_height)), (filled, 0))
+        filled *= 2
+
+    filled = tile_height
+    while filled < height:
+        canvas.paste(canvas.crop((0, 0, width, filled)), (0, filled))
+        filled *= 2
+
+    return canvas
+
+
+def _build_overlay(width: int, height: int, font_size: int) -> Image.Image:
+    tile, horizontal_spacing, vertical_spacing = _render_tile(font_size)
+    tile_width, tile_height = tile.size
+
+    num_cols = int(width / horizontal_spacing) + 2
+    num_rows = int(height / vertical_spacing) + 2
+    start_x = int((width - (num_cols - 1) * tile_width) / 2)
+    start_y = int((height - (num_rows - 1) * tile_height) / 2)
+
+    offset_x = -start_x % tile_width
+    offset_y = -start_y % tile_height
+    canvas = _tile_across(tile, width + offset_x, height + offset_y)
+    return canvas.crop((offset_x, offset_y, offset_x + width, offset_y + height))
+
+
+def get_overlay(width: int, height: int, font_size: int = None) -> Image.Image:
+    if font_size is None:
+        font_size = watermark_font_size(width, height)
+    key = (width, height, font_size)
+
+    with _overlay_lock:
+        overlay = _overlay_cache.get(key)
+        if overlay is not None:
+            _overlay_cache.move_to_end(key)
+            return overlay
+
+    overlay = _build_overlay(width, height, font_size)
+
+    with _overlay_lock:
+        _overlay_cache[key] = overlay
+        while len(_overlay_cache) > settings.watermark_overlay_cache_size:
+            _overlay_cache.popitem(last=False)
+
+    logger.debug(f"Watermark overlay built for {width}x{height}, font {font_size}")
+    return overlay
+
+
+def apply_watermark(image: Image.Image) -> Image.Image:
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    return Image.alpha_composite(image, get_overlay(*image.size))
@@ -9,6 +9,9 @@ from sqlalchemy.pool import NullPool
 from repositories.image_repositories import ImageRepository
 from services.image_service import ImageService
 from services.telegram_storage import TelegramStorage
+from services.http_client import close_http_session
+from services.result_cache import close_result_cache
+from services.image_executor import run_image_job
 from datetime import datetime, timedelta, timezone
 
 celery_app = Celery(
@@ -47,37 +50,41 @@ async def delete_previous_messages(bot, telegram_id: int, message_ids: list):
         await asyncio.sleep(0.1)
 
 
-async def process_and_upload_improved_version(bot, original_file_id: str, image_key: str) -> dict:
+async def process_and_upload_improved_version(bot, original_file_id: str, image_key: str,
+                                              standard_transparent_file_id: str = None) -> dict:
 
     try:
         logger.info(f"📥 Downloading original from channel for {image_key}")
-        file = await bot.get_file(original_file_id)
-        original_bytes = await bot.download_file(file.file_path)
-        original_bytes = original_bytes.read()
+        original_bytes = await TelegramStorage.download(bot, original_file_id)
         
-        logger.info(f"✨ Creating improved version for {image_key}")
-        transparent_improved = ImageService.remove_background(original_bytes, improved=True)
+        variants = None
+        if settings.improved_mode == "local" and standard_transparent_file_id:
+            logger.info(f"✨ Refining standard cutout locally for {image_key}")
+            try:
+                # Inside the try: a failed download (e.g. over getFile's 20 MB limit) also falls back to remote
+                standard_bytes = await TelegramStorage.download(bot, standard_transparent_file_id)
+                variants = await run_image_job(ImageService.render_improved_variants, standard_bytes, original_bytes)
+            except Exception as e:
+                logger.warning(f"Local refinement unusable for {image_key} ({e}), requesting improved removal")
         
-        if not transparent_improved or len(transparent_improved) == 0:
-            raise ValueError("Improved background removal returned empty data")
-        
-        bw_improved = ImageService.convert_to_black_and_white(transparent_improved)
+        if variants is None:
+            logger.info(f"✨ Creating improved version for {image_key}")
+            transparent_improved = await ImageService.remove_background_async(original_bytes, improved=True)
+            
+            if not transparent_improved or len(transparent_improved) == 0:
+                raise ValueError("Improved background removal returned empty data")
+            
+            logger.info(f"💧 Rendering B&W and watermarks for improved {image_key}")
+            variants = await run_image_job(ImageService.render_variants, transparent_improved, original_bytes)
         
-        if not bw_improved or len(bw_improved) == 0:
+        if not variants['bw_bytes'] or len(variants['bw_bytes']) == 0:
             raise ValueError("B&W conversion returned empty data")
         
-        logger.info(f"💧 Adding watermarks to improved for {image_key}")
-        transparent_watermarked = ImageService.add_watermarks(transparent_improved)
-        bw_watermarked = ImageService.add_watermarks(bw_improved)
-        
         logger.info(f"📤 Uploading improved versions to channel for {image_key}")
         file_ids = await TelegramStorage.upload_improved_versions(
             bot=bot,
-            transparent_bytes=transparent_improved,
-            bw_bytes=bw_improved,
-            transparent_watermarked=transparent_watermarked,
-            bw_watermarked=bw_watermarked,
-            image_key=image_key
+            image_key=image_key,
+            **variants
         )
         
         logger.info(f"✅ Improved versions uploaded successfully for {image_key}")
@@ -255,7 +262,8 @@ async def process_discounts():
                     
                     try:
                         file_ids = await process_and_upload_improved_version(
-                            bot, image.original_file_id, image.image_key
+                            bot, image.original_file_id, image.image_key,
+                            image.standard_transparent_file_id
                         )
                         
                         await image_repo.save_improved_versions(
@@ -372,6 +380,8 @@ async def process_discounts():
         logger.error(f"❌ Error in process_discounts: {e}", exc_info=True)
     finally:
         await bot.session.close()
+        await close_http_session()
+        await close_result_cache()
         await engine.dispose()
 
 